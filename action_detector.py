@@ -1,54 +1,70 @@
-import mediapipe as mp
-import cv2
 import time
 from collections import defaultdict, deque
+from pose_estimator import TrackPoseEstimator
 
-mp_pose = mp.solutions.pose
+# mediapipe.solutions.pose.PoseLandmark.NOSE; mediapipe itself is only imported when a pose graph is built
+NOSE = 0
 
 class ActionDetector:
-    def __init__(self, loiter_seconds=60):
-        self.pose = mp_pose.Pose(static_image_mode=False, min_detection_confidence=0.5)
-        self.track_times = defaultdict(lambda: time.time())
+    def __init__(self, loiter_seconds=60, track_timeout=2.0, pose_every_k=5, pose_motion_thresh=20.0,
+                 pose_workers=2, max_pose_contexts=8, pose_factory=None, pose_pool=None):
+        # one pose context per track, re-run every pose_every_k frames or on fast motion
+        self.pose = TrackPoseEstimator(every_k=pose_every_k, motion_thresh=pose_motion_thresh,
+                                       workers=pose_workers, max_contexts=max_pose_contexts,
+                                       pose_factory=pose_factory, pose_pool=pose_pool)
+        self.frame_idx = 0
+        self.track_times = {}  # {track_id: first seen}
         self.loiter_seconds = loiter_seconds
-        # naive store of previous centers to get motion magnitude (idless)
+        # per-track state is dropped once a track has not been seen for track_timeout seconds
+        self.track_timeout = track_timeout
+        self.last_seen = {}
         self.prev_centers = {}
         self.motion_deques = defaultdict(lambda: deque(maxlen=5))
 
     def analyze(self, frame, persons):
         """
-        persons: list of {'box':(x1,y1,x2,y2), ...}
+        persons: list of {'box':(x1,y1,x2,y2), 'track_id': ..., ...} (see tracker.Tracker);
+                 without 'track_id' the list index is used as id
         returns: dict with keys 'actions' (list) and 'loitering' True/False
         """
         actions = []
         now = time.time()
         loitering_flag = False
-        for i, p in enumerate(persons):
+        self.frame_idx += 1
+        h,w = frame.shape[:2]
+        visible = []
+        pose_jobs = {}
+        for idx, p in enumerate(persons):
+            i = p.get('track_id', idx)
+            self.last_seen[i] = now
             x1,y1,x2,y2 = p['box']
-            h,w = frame.shape[:2]
             # clamp cropping
             x1c, y1c = max(0,x1), max(0,y1)
             x2c, y2c = min(w-1,x2), min(h-1,y2)
             if x2c-x1c < 20 or y2c-y1c < 20:
                 continue
-            crop = frame[y1c:y2c, x1c:x2c]
-            # pose on crop (fast)
-            res = self.pose.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
-            fell = False
-            if res.pose_landmarks:
+            visible.append(i)
+            # push into motion history (naive)
+            center = ((x1+x2)//2, (y1+y2)//2)
+            prev = self.prev_centers.get(i)
+            if prev:
+                motion = ((center[0]-prev[0])**2 + (center[1]-prev[1])**2)**0.5
+            else:
+                motion = 0.0
+            self.prev_centers[i] = center
+            self.motion_deques[i].append(motion)
+            if self.pose.due(i, self.frame_idx, motion):
+                pose_jobs[i] = frame[y1c:y2c, x1c:x2c]
+        # pose on crops (fast), only for tracks that are due
+        self.pose.run(pose_jobs, self.frame_idx)
+        for i in visible:
+            landmarks = self.pose.latest(i)
+            if landmarks:
                 # simple fall detection: large vertical movement of nose or torso over short time
                 # (placeholder heuristics; tune after tests)
-                lm = res.pose_landmarks.landmark
+                lm = landmarks.landmark
                 # use nose y normalized
-                nose_y = lm[mp_pose.PoseLandmark.NOSE].y
-                # push into motion history (naive)
-                center = ((x1+x2)//2, (y1+y2)//2)
-                prev = self.prev_centers.get(i)
-                if prev:
-                    motion = ((center[0]-prev[0])**2 + (center[1]-prev[1])**2)**0.5
-                else:
-                    motion = 0.0
-                self.prev_centers[i] = center
-                self.motion_deques[i].append(motion)
+                nose_y = lm[NOSE].y
                 # if motion high and bounding box center low in frame -> possible fall/violent
                 if sum(self.motion_deques[i]) / len(self.motion_deques[i]) > 40.0:
                     actions.append({'id': i, 'type': 'violent_motion'})
@@ -62,4 +78,16 @@ class ActionDetector:
             duration = now - self.track_times[i]
             if duration > self.loiter_seconds:
                 loitering_flag = True
+        self._forget_stale(now)
         return {'actions': actions, 'loitering': loitering_flag}
+
+    def _forget_stale(self, now):
+        for tid in [t for t, seen in self.last_seen.items() if now - seen > self.track_timeout]:
+            del self.last_seen[tid]
+            self.track_times.pop(tid, None)
+            self.prev_centers.pop(tid, None)
+            self.motion_deques.pop(tid, None)
+            self.pose.forget(tid)
+
+    def close(self):
+        self.pose.close()
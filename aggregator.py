@@ -0,0 +1,187 @@
+"""
+Central side of the edge/central split: accepts detection records from any number
+of edges (edge.py, or main.py with ATM_CENTRAL set), runs a DecisionEngine per
+camera and raises alerts through the same collector, SSE events and dashboard as
+app.py, which it serves.
+
+    python aggregator.py --port 7000 --http-port 5000
+    python edge.py --central 127.0.0.1:7000 --edge-id sim1 --simulate &
+    python edge.py --central 127.0.0.1:7000 --edge-id sim2 --simulate &
+
+Remote cameras are named <edge_id>.<camera_id>; /edges lists them.
+"""
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+from functools import partial
+from werkzeug.utils import secure_filename
+from decision import DecisionEngine
+from edge_protocol import decode, read_message, ProtocolError
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+
+class RemoteCamera:
+    """State the aggregator keeps per edge camera; survives reconnects."""
+    def __init__(self, key, edge_id, camera_id, **decision_cfg):
+        self.key = key
+        self.edge_id = edge_id
+        self.camera_id = camera_id
+        self.decision = DecisionEngine(**decision_cfg)
+        self.state = None        # (active, level) last published
+        self.connected = False
+        self.peer = None
+        self.records = 0
+        self.last_seq = None
+        self.gaps = 0            # records the edge dropped or never sent
+        self.last_ts = None
+        self.last_score = 0.0
+
+    def stats(self):
+        return {'camera_id': self.key, 'edge_id': self.edge_id, 'edge_camera_id': self.camera_id,
+                'connected': self.connected, 'peer': self.peer, 'records': self.records, 'gaps': self.gaps,
+                'last_ts': self.last_ts, 'lag': round(time.time() - self.last_ts, 3) if self.last_ts else None,
+                'score': self.last_score}
+
+
+class Aggregator:
+    """
+    TCP server for edge_protocol streams; one thread per connected edge camera.
+    Each record is decoded and evaluated by that camera's DecisionEngine at the
+    edge's capture time, then handed to on_decision(camera, record, decision).
+    """
+    def __init__(self, host='0.0.0.0', port=7000, on_decision=None, decision_cfg=None):
+        self.address = (host, port)
+        self.on_decision = on_decision
+        self.decision_cfg = decision_cfg or {}
+        self.cameras = {}    # {key: RemoteCamera}
+        self.lock = threading.Lock()
+        self.sock = None
+        self.stop_flag = False
+
+    def start(self):
+        self.sock = socket.create_server(self.address)
+        self.address = self.sock.getsockname()[:2]
+        threading.Thread(target=self._accept, name="aggregator", daemon=True).start()
+        log.info("aggregator listening on %s:%d", *self.address)
+        return self
+
+    def _accept(self):
+        while not self.stop_flag:
+            try:
+                conn, peer = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn, peer), name=f"edge-{peer[0]}:{peer[1]}",
+                             daemon=True).start()
+
+    def _camera(self, hello):
+        key = secure_filename(f"{hello['edge_id']}.{hello['camera_id']}") or 'edge'
+        with self.lock:
+            cam = self.cameras.get(key)
+            if cam is None:
+                cam = self.cameras[key] = RemoteCamera(key, hello['edge_id'], hello['camera_id'],
+                                                       **self.decision_cfg)
+        return cam
+
+    def _serve(self, conn, peer):
+        cam = None
+        f = conn.makefile('rb')
+        try:
+            payload = read_message(f)
+            hello = decode(payload) if payload else None
+            if not hello or hello['type'] != 'hello':
+                raise ProtocolError("expected HELLO first")
+            cam = self._camera(hello)
+            cam.connected, cam.peer = True, f"{peer[0]}:{peer[1]}"
+            log.info("edge connected camera=%s peer=%s", cam.key, cam.peer)
+            if self.on_decision:
+                self.on_decision(cam, None, None)
+            while not self.stop_flag:
+                payload = read_message(f)
+                if payload is None:
+                    break
+                self._handle(cam, decode(payload))
+        except (OSError, ProtocolError, ValueError) as e:
+            log.warning("edge connection error peer=%s:%d: %s", peer[0], peer[1], e)
+        finally:
+            f.close()
+            conn.close()
+            if cam is not None:
+                cam.connected = False
+                log.info("edge disconnected camera=%s", cam.key)
+                if self.on_decision:
+                    self.on_decision(cam, None, None)
+
+    def _handle(self, cam, rec):
+        if rec['type'] != 'detections':
+            return
+        if cam.last_seq is not None and rec['seq'] > cam.last_seq + 1:
+            cam.gaps += rec['seq'] - cam.last_seq - 1
+        cam.last_seq = rec['seq']
+        cam.records += 1
+        cam.last_ts = rec['ts']
+        registry.inc('edge_records_total', camera=cam.key)
+        # decay/persistence run on the edge's clock, so network jitter doesn't change decisions
+        decision = cam.decision.evaluate(rec['persons'], rec['weapons'], rec['tamper'], rec['action'], now=rec['ts'],
+                                         inferred=rec['inferred'])
+        cam.last_score = decision.score
+        if self.on_decision:
+            self.on_decision(cam, rec, decision)
+
+    def stop(self):
+        self.stop_flag = True
+        if self.sock:
+            self.sock.close()
+
+    def stats(self):
+        with self.lock:
+            cams = list(self.cameras.values())
+        return [c.stats() for c in cams]
+
+
+def dashboard_handler(dashboard):
+    """on_decision for Aggregator that publishes into app.py's alert collector, alerts and events."""
+    def on_decision(cam, rec, decision):
+        if decision is None:
+            dashboard.events.publish('camera', {"camera_id": cam.key, "running": cam.connected, "remote": True})
+            return
+        if (decision.active, decision.level) != cam.state:
+            cam.state = (decision.active, decision.level)
+            dashboard.events.publish('state', {"camera_id": cam.key, "active": decision.active,
+                                               "level": decision.level, "reasons": decision.reasons,
+                                               "incident": decision.incident})
+        if decision.raise_alert:
+            registry.inc('alerts_total', camera=cam.key, level=decision.level)
+            alert = dashboard.alert_collector.add_alert(decision.level, decision.reasons, status="Queued",
+                                                        camera_id=cam.key, incident=decision.incident)
+            # no pixels leave the edge, so remote alerts carry no snapshot
+            dashboard.alert_manager.send(decision, None, camera_id=cam.key,
+                                         on_status=partial(dashboard.alert_collector.update_status, alert))
+    return on_decision
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--host', default='0.0.0.0')
+    ap.add_argument('--port', type=int, default=7000, help="port edges connect to")
+    ap.add_argument('--http-port', type=int, default=5000, help="dashboard port")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    # app.py brings the dashboard, alert store, SSE events and alert delivery; its
+    # detection models are only loaded if a local camera is started
+    import app as dashboard
+    from flask import jsonify
+    dashboard.create_app()
+    aggregator = Aggregator(args.host, args.port, on_decision=dashboard_handler(dashboard)).start()
+    dashboard.app.add_url_rule('/edges', 'edges', lambda: jsonify(aggregator.stats()))
+    dashboard.app.run(host=args.host, port=args.http_port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
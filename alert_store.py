@@ -0,0 +1,162 @@
+import json
+import logging
+import threading
+from queue import Queue, Empty
+from sqlalchemy import (create_engine, event, MetaData, Table, Column, Integer, Float, String, Text,
+                        Index, select, func, inspect, text)
+
+log = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+alerts_table = Table(
+    'alerts', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('timestamp', Float, nullable=False),
+    Column('camera_id', String(64), nullable=False),
+    Column('level', String(16), nullable=False),
+    Column('reasons', Text, nullable=False),    # JSON list
+    Column('status', String(16)),
+    Column('snapshot_path', Text),
+    Column('delivery', Text),                   # JSON {channel: status}
+    Column('clip_path', Text),
+    Column('incident', Integer),                # DecisionEngine incident id (per camera)
+    Index('ix_alerts_timestamp', 'timestamp'),
+    Index('ix_alerts_camera_id', 'camera_id', 'id'),
+    Index('ix_alerts_level', 'level', 'id'),
+)
+
+
+class AlertStore:
+    """
+    SQLite-backed alert history.
+    add()/update() only queue the write; the writer thread commits as soon as a write
+    arrives, together with whatever else has queued up meanwhile (at most batch_size
+    writes per transaction). Alert ids are assigned on add() and queued in id order, so
+    they are committed in that order and double as the `since` cursor.
+    """
+    def __init__(self, url='sqlite:///alerts.db', flush_interval=1.0, batch_size=200):
+        self.engine = create_engine(url, connect_args={'check_same_thread': False})
+        if url.startswith('sqlite'):
+            event.listen(self.engine, 'connect', self._sqlite_pragmas)
+        metadata.create_all(self.engine)
+        # databases created by older versions lack the newer columns
+        existing = {c['name'] for c in inspect(self.engine).get_columns('alerts')}
+        with self.engine.begin() as conn:
+            for name, sql_type in (('clip_path', 'TEXT'), ('incident', 'INTEGER')):
+                if name not in existing:
+                    conn.execute(text(f'ALTER TABLE alerts ADD COLUMN {name} {sql_type}'))
+        with self.engine.connect() as conn:
+            self._next_id = (conn.execute(select(func.max(alerts_table.c.id))).scalar() or 0) + 1
+        self._id_lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = Queue()
+        threading.Thread(target=self._writer, name="alert-store", daemon=True).start()
+
+    @staticmethod
+    def _sqlite_pragmas(dbapi_conn, _):
+        # WAL lets the dashboard read while the writer thread commits
+        cur = dbapi_conn.cursor()
+        cur.execute('PRAGMA journal_mode=WAL')
+        cur.execute('PRAGMA synchronous=NORMAL')
+        cur.close()
+
+    def add(self, alert):
+        """Assigns alert['id'] and queues the insert."""
+        with self._id_lock:
+            alert['id'] = self._next_id
+            self._next_id += 1
+            # queued under the lock: a later id committed first would make `since` pollers skip this one
+            self.pending.put(('insert', self._row(alert)))
+        return alert['id']
+
+    def update(self, alert_id, **fields):
+        if 'delivery' in fields:
+            fields['delivery'] = json.dumps(fields['delivery'])
+        self.pending.put(('update', (alert_id, fields)))
+
+    @staticmethod
+    def _row(alert):
+        return {
+            'id': alert['id'],
+            'timestamp': alert['timestamp'],
+            'camera_id': alert['camera_id'],
+            'level': alert['level'],
+            'reasons': json.dumps(list(alert['reasons'])),
+            'status': alert.get('status'),
+            'snapshot_path': alert.get('snapshot_path'),
+            'delivery': json.dumps(alert.get('delivery') or {}),
+            'clip_path': alert.get('clip_path'),
+            'incident': alert.get('incident'),
+        }
+
+    def _writer(self):
+        while True:
+            try:
+                ops = [self.pending.get(timeout=self.flush_interval)]
+            except Empty:
+                continue
+            while len(ops) < self.batch_size:
+                try:
+                    ops.append(self.pending.get_nowait())
+                except Empty:
+                    break
+            try:
+                self._commit(ops)
+            except Exception as e:
+                log.error("alert store write error: %s", e)
+
+    def _commit(self, ops):
+        with self.engine.begin() as conn:
+            inserts = []
+            for kind, payload in ops:
+                if kind == 'insert':
+                    inserts.append(payload)
+                    continue
+                # keep ordering: an update may target a row inserted earlier in this batch
+                if inserts:
+                    conn.execute(alerts_table.insert(), inserts)
+                    inserts = []
+                alert_id, fields = payload
+                conn.execute(alerts_table.update().where(alerts_table.c.id == alert_id).values(**fields))
+            if inserts:
+                conn.execute(alerts_table.insert(), inserts)
+
+    def query(self, camera_id=None, level=None, since=None, before=None, limit=50):
+        """
+        since: return alerts with id > since, oldest first (polling cursor)
+        before: return the page of alerts older than this id
+        Without since, the newest `limit` alerts are returned, oldest first.
+        """
+        t = alerts_table
+        q = select(t)
+        if camera_id is not None:
+            q = q.where(t.c.camera_id == camera_id)
+        if level is not None:
+            q = q.where(t.c.level == level)
+        if before is not None:
+            q = q.where(t.c.id < before)
+        if since is not None:
+            q = q.where(t.c.id > since).order_by(t.c.id.asc()).limit(limit)
+        else:
+            q = q.order_by(t.c.id.desc()).limit(limit)
+        with self.engine.connect() as conn:
+            rows = [self._to_dict(r) for r in conn.execute(q).mappings()]
+        return rows if since is not None else rows[::-1]
+
+    def get(self, alert_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(alerts_table).where(alerts_table.c.id == alert_id)).mappings().first()
+        return self._to_dict(row) if row else None
+
+    def latest(self, camera_id=None):
+        rows = self.query(camera_id=camera_id, limit=1)
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _to_dict(row):
+        d = dict(row)
+        d['reasons'] = json.loads(d['reasons'])
+        d['delivery'] = json.loads(d['delivery']) if d['delivery'] else {}
+        return d
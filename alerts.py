@@ -1,36 +1,143 @@
-import os, cv2
-from datetime import datetime
-from twilio.rest import Client
+import os
+import time
+import logging
+import threading
+from queue import Queue, Full
+from metrics import registry
+from snapshot_store import SnapshotStore
+
+log = logging.getLogger(__name__)
+
+class AlertDispatcher:
+    """
+    Delivers alert notifications off the detection thread.
+    Each channel ('sms', 'email', 'call') has its own bounded queue and worker thread,
+    so a slow SMTP server never holds up SMS or calls. Failed deliveries are retried
+    with exponential backoff; on_status(channel, status) is called as a job moves
+    through 'queued' -> 'sent' / 'failed' / 'skipped' / 'dropped'.
+    """
+    def __init__(self, handlers, queue_size=100, retries=3, backoff=1.0):
+        self.handlers = handlers  # {channel: callable(*args) -> 'skipped' or None}
+        self.retries = retries
+        self.backoff = backoff
+        self.queues = {ch: Queue(maxsize=queue_size) for ch in handlers}
+        for ch in handlers:
+            threading.Thread(target=self._worker, args=(ch,), name=f"alert-{ch}", daemon=True).start()
+
+    def submit(self, channel, args, on_status=None):
+        # report before put so a fast worker's 'sent' can't be overwritten by 'queued'
+        self._report(on_status, channel, 'queued')
+        try:
+            self.queues[channel].put_nowait((args, on_status, time.monotonic()))
+        except Full:
+            log.warning("alert queue full; notification dropped channel=%s", channel)
+            registry.inc('alert_deliveries_total', channel=channel, status='dropped')
+            self._report(on_status, channel, 'dropped')
+            return False
+        return True
+
+    def _report(self, on_status, channel, status):
+        if on_status:
+            try:
+                on_status(channel, status)
+            except Exception as e:
+                log.error("alert status callback error: %s", e)
+
+    def _worker(self, channel):
+        handler = self.handlers[channel]
+        q = self.queues[channel]
+        while True:
+            args, on_status, queued_at = q.get()
+            delay = self.backoff
+            for attempt in range(self.retries + 1):
+                try:
+                    status = handler(*args) or 'sent'
+                    break
+                except Exception as e:
+                    log.warning("delivery error channel=%s attempt=%d: %s", channel, attempt + 1, e)
+                    status = 'failed'
+                    if attempt < self.retries:
+                        time.sleep(delay)
+                        delay *= 2
+            # queue wait + delivery, retries included
+            registry.observe('alert_dispatch_seconds', time.monotonic() - queued_at, channel=channel)
+            registry.inc('alert_deliveries_total', channel=channel, status=status)
+            self._report(on_status, channel, status)
+            q.task_done()
+
 
 class AlertManager:
-    def __init__(self, snapshot_dir='snapshots', twilio_cfg=None, smtp_cfg=None, alert_cooldown=30):
-        os.makedirs(snapshot_dir, exist_ok=True)
-        self.snapshot_dir = snapshot_dir
+    def __init__(self, snapshot_dir='snapshots', twilio_cfg=None, smtp_cfg=None, alert_cooldown=0,
+                 twilio_client=None, queue_size=100, retries=3, backoff=1.0, snapshot_quality=85,
+                 snapshot_store=None):
+        # snapshots are written by the store's own thread, see snapshot_store.py
+        self.snapshots = snapshot_store or SnapshotStore(snapshot_dir, quality=snapshot_quality)
+        self.snapshot_dir = self.snapshots.root
         self.twilio_cfg = twilio_cfg
         self.smtp_cfg = smtp_cfg
-        self.last_alert_time = 0
+        self.last_alert_time = {}  # {camera_id: timestamp}, so one camera can't mute another
+        # DecisionEngine already raises one alert per incident; this is an optional
+        # extra per-camera rate limit on notifications
         self.alert_cooldown = alert_cooldown
+        # Twilio client and SMTP connection are created once and reused by the workers
+        self._twilio_client = twilio_client
+        self._smtp = None
+        self.dispatcher = AlertDispatcher({
+            'sms': self.send_sms,
+            'email': self.send_email,
+            'call': self.make_twilio_call,
+        }, queue_size=queue_size, retries=retries, backoff=backoff)
 
-    def save_snapshot(self, frame, decision=None):
-        ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    def save_snapshot(self, frame, decision=None, camera_id=None, alert_id=None):
+        """Queues the snapshot write and returns its path (the file appears shortly after)."""
         label = "_".join(decision.reasons) if decision and decision.reasons else "alert"
-        fname = os.path.join(self.snapshot_dir, f"{label}_{ts}.jpg")
-        cv2.imwrite(fname, frame)
-        return fname
+        store = self.snapshots
+        if hasattr(frame, 'jpeg'):
+            # frames.AnnotatedFrame: overlays drawn once, encodes go through its per-frame cache
+            # (shared with any consumer at the same settings); the store thread only writes files
+            shape = frame.shape
+            return store.save(frame.annotated, camera_id=camera_id, label=label, alert_id=alert_id,
+                              jpeg=frame.jpeg(store.quality, store.fit(shape, store.max_width)),
+                              thumb=frame.jpeg(store.thumb_quality, store.fit(shape, store.thumb_width)))
+        return store.save(frame, camera_id=camera_id, label=label, alert_id=alert_id)
+
+    def twilio_client(self):
+        if self._twilio_client is None:
+            from twilio.rest import Client   # deferred: only needed once an SMS/call goes out
+            self._twilio_client = Client(self.twilio_cfg['account_sid'], self.twilio_cfg['auth_token'])
+        return self._twilio_client
+
+    def _smtp_connection(self):
+        import smtplib
+        if self._smtp is None:
+            # 'ssl': False allows a plain local SMTP (debug) server
+            if self.smtp_cfg.get("ssl", True):
+                server = smtplib.SMTP_SSL(self.smtp_cfg["server"], self.smtp_cfg.get("port", 465))
+            else:
+                server = smtplib.SMTP(self.smtp_cfg["server"], self.smtp_cfg.get("port", 25))
+            if self.smtp_cfg.get("username"):
+                server.login(self.smtp_cfg["username"], self.smtp_cfg["password"])
+            self._smtp = server
+        return self._smtp
+
+    def _drop_smtp(self):
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
 
     def send_sms(self, body):
-        if not self.twilio_cfg:
-            print("Twilio config missing; SMS skipped")
-            return
-        client = Client(self.twilio_cfg['account_sid'], self.twilio_cfg['auth_token'])
-        client.messages.create(to=self.twilio_cfg['to'], from_=self.twilio_cfg['from'], body=body)
+        if not self.twilio_cfg or not self.twilio_cfg.get('account_sid'):
+            log.info("Twilio config missing; SMS skipped")
+            return 'skipped'
+        self.twilio_client().messages.create(to=self.twilio_cfg['to'], from_=self.twilio_cfg['from'], body=body)
 
     def send_email(self, subject, body, attachments=None):
-        import smtplib
         from email.message import EmailMessage
-        if not self.smtp_cfg:
-            print("SMTP config missing; email skipped")
-            return
+        if not self.smtp_cfg or not self.smtp_cfg.get('to'):
+            log.info("SMTP config missing; email skipped")
+            return 'skipped'
         msg = EmailMessage()
         msg["Subject"] = subject
         msg["From"] = self.smtp_cfg["from"]
@@ -39,43 +146,57 @@ class AlertManager:
         # Attach files
         if attachments:
             for path in attachments:
-                with open(path, "rb") as f:
-                    data = f.read()
-                    msg.add_attachment(data, maintype="image", subtype="jpeg", filename=os.path.basename(path))
+                # wait() also returns once a write has failed, so the file may still be missing
+                self.snapshots.wait(path)
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except OSError as e:
+                    # failed write or already evicted by retention: the alert still goes out
+                    log.warning("email attachment missing path=%s: %s", path, e)
+                    continue
+                msg.add_attachment(data, maintype="image", subtype="jpeg", filename=os.path.basename(path))
         try:
-            with smtplib.SMTP_SSL(self.smtp_cfg["server"], self.smtp_cfg.get("port", 465)) as server:
-                server.login(self.smtp_cfg["username"], self.smtp_cfg["password"])
-                server.send_message(msg)
-            print("Email sent!")
-        except Exception as e:
-            print("Email send error:", e)
+            self._smtp_connection().send_message(msg)
+        except Exception:
+            # stale or broken connection: reconnect on the next attempt
+            self._drop_smtp()
+            raise
+        log.info("email sent to=%s", self.smtp_cfg["to"])
+
     def make_twilio_call(self, message=None):
-        if not self.twilio_cfg:
-            print("Twilio config missing; call skipped")
-            return
-        client = Client(self.twilio_cfg['account_sid'], self.twilio_cfg['auth_token'])
-        try:
-            call = client.calls.create(
-                to=self.twilio_cfg['to'],
-                from_=self.twilio_cfg['from'],
-                twiml=f'<Response><Say>{message or "Emergency at ATM!"}</Say></Response>'
-            )
-            print("Twilio call initiated! SID:", call.sid)
-        except Exception as e:
-            print("Twilio call error:", e)
+        if not self.twilio_cfg or not self.twilio_cfg.get('account_sid'):
+            log.info("Twilio config missing; call skipped")
+            return 'skipped'
+        call = self.twilio_client().calls.create(
+            to=self.twilio_cfg['to'],
+            from_=self.twilio_cfg['from'],
+            twiml=f'<Response><Say>{message or "Emergency at ATM!"}</Say></Response>'
+        )
+        log.info("Twilio call initiated sid=%s", call.sid)
 
-    def send(self, decision, frame):
-        import time
+    def send(self, decision, frame, camera_id=None, on_status=None, snapshot_path=None):
+        """
+        Saves the snapshot (unless snapshot_path already points at one, or there is no
+        frame, as for alerts from remote edges) and queues SMS/email/call; returns immediately.
+        on_status(channel, status) receives delivery updates from the dispatch workers.
+        returns: False if suppressed by the cooldown, True otherwise
+        """
         now = time.time()
-        if now - self.last_alert_time < self.alert_cooldown:
-            print("Alert suppressed due to cooldown.")
-            return
-        self.last_alert_time = now
-        snap = self.save_snapshot(frame, decision)
+        if now - self.last_alert_time.get(camera_id, 0) < self.alert_cooldown:
+            log.info("alert suppressed by cooldown camera=%s", camera_id)
+            return False
+        self.last_alert_time[camera_id] = now
+        snap = snapshot_path
+        if snap is None and frame is not None:
+            snap = self.save_snapshot(frame, decision, camera_id=camera_id)
         body = f"ALERT: {decision.level}\nReasons: {decision.reasons}"
-        print("ALERT:", body, "snapshot saved to", snap)
-        # send SMS/email/call if configured
-        self.send_sms(body)
-        self.send_email(f"ATM Alert - {decision.level}", body, attachments=[snap])
-        self.make_twilio_call(message=body)
- 
\ No newline at end of file
+        if camera_id:
+            body = f"Camera: {camera_id}\n" + body
+        log.warning("ALERT camera=%s level=%s reasons=%s snapshot=%s", camera_id, decision.level,
+                    ",".join(decision.reasons), snap)
+        # queue SMS/email/call; each is skipped by its worker if not configured
+        self.dispatcher.submit('sms', (body,), on_status)
+        self.dispatcher.submit('email', (f"ATM Alert - {decision.level}", body, [snap] if snap else []), on_status)
+        self.dispatcher.submit('call', (body,), on_status)
+        return True
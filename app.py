@@ -1,46 +1,279 @@
-from flask import Flask, render_template, Response, request, jsonify
-import cv2
+from flask import Flask, render_template, Response, request, jsonify, send_file
 import threading
-from queue import Queue
+import time
+import logging
+from functools import partial
 import os
+import json
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import cv2
 from werkzeug.utils import secure_filename
-from detectors import PersonWeaponDetector
+from detectors import PersonWeaponDetector, BatchInferenceEngine
 from tamper import TamperDetector
 from action_detector import ActionDetector
+from tracker import Tracker
 from decision import DecisionEngine
 from alerts import AlertManager
+from alert_store import AlertStore
+from streaming import FrameBroadcaster
+from capture import FrameGrabber
+from scheduler import AdaptiveScheduler
+from roi import RegionOfInterest
+from mp_pipeline import MultiprocessPipeline
+from frames import AnnotatedFrame
+from recorder import ClipRecorder
+from metrics import registry
+from model_registry import models, PosePool, warm_detector
+from events import EventBus, SnapshotCache
+from snapshot_store import SnapshotStore
+import forensic
+
+# LOG_LEVEL=DEBUG adds a line per processed frame
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s %(message)s')
+log = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-frame_queue = None
-pipeline_thread = None
-stop_flag = False
+DEFAULT_CAMERA = 'default'
+
+pipelines = {}  # {camera_id: CameraPipeline}
+pipelines_lock = threading.Lock()
 recent_alerts = []
+# Dashboard push: alert and detection-state events go out over /events (SSE), and the
+# newest snapshot per camera is served from memory (see events.py)
+events = EventBus()
+snapshot_cache = SnapshotCache()
+
+# One model instance is shared by every camera pipeline. Frames from all cameras
+# go through a single batching engine, which also keeps the (non thread-safe)
+# ultralytics predictors on one thread.
+inference_cfg = {
+    'max_batch': 8,
+    'max_wait': 0.05,   # upper bound on waiting for cameras that haven't submitted yet
+    'imgsz': 320,
+    'conf': 0.35,
+    'parallel': False,  # run person and weapon models concurrently
+    'as_arrays': True,  # hand detections around as detectors.Detections arrays
+}
+detector_cfg = {
+    'device': 'cpu',
+    'backend': 'ultralytics',  # 'onnx' exports the .pt files once and serves them with ONNX Runtime
+    'backend_cfg': {},         # onnx: {'threads': 4, 'int8': False, 'cache_dir': 'model_cache'}
+    'two_stage': False,        # weapon model only on full-resolution crops around persons
+    'weapon_imgsz': 416,
+}
+# Per-camera regions of interest: {camera_id: {name: [(x, y), ...]}}; also settable per
+# /start_detection request with a JSON 'roi' form field
+roi_cfg = {}
+# Capture: decode on a separate thread, keep only the newest frame
+capture_cfg = {
+    'ring_size': 1,
+    'max_age': 1.0,      # seconds; older frames are dropped instead of processed late
+    'max_width': 1280,   # downscale larger streams right after decode
+    'hw_accel': False,   # ask OpenCV for hardware-accelerated decode if available
+}
+# Inference scheduling: idle cameras only get a heartbeat inference every idle_interval
+# seconds; motion, people or a rising decision score speed it up (see scheduler.py)
+scheduler_cfg = {
+    'idle_interval': 2.0,
+    'motion_interval': 0.2,
+    'active_interval': 0.0,
+    'cpu_budget': 0.5,   # share of one core a camera's inference may use
+}
+# MJPEG output: each frame is encoded once per camera, whatever the number of viewers
+stream_cfg = {
+    'quality': 70,
+    'size': (640, 360),
+    'every_n': 2,  # stream every 2nd frame for speed
+}
+# Alert clips: the last pre_roll seconds are kept as JPEGs (capped at max_bytes per
+# camera) and written out with post_roll seconds after each alert. Same quality/size
+# as stream_cfg so recorded frames reuse the stream's encode.
+clip_cfg = {
+    'pre_roll': 10.0,
+    'post_roll': 10.0,
+    'max_bytes': 32 * 1024 * 1024,
+    'quality': 70,
+    'size': (640, 360),
+}
+# Execution: 'threads' runs every camera in this process around the shared batching
+# engine; 'processes' gives each camera its own capture, detection (detect_workers
+# processes, one model copy each) and tracking/pose processes, see mp_pipeline.py
+execution_cfg = {
+    'mode': 'threads',
+    'detect_workers': 2,
+}
+# Per-stage timings, queue depths and delivery latency at /metrics (Prometheus) and
+# /stats (JSON); with 'enabled': False the instrumentation becomes a no-op
+metrics_cfg = {
+    'enabled': True,
+}
+registry.enabled = metrics_cfg['enabled']
+# Offline forensic scans of uploaded files (see forensic.py): one job at a time, each using
+# every core; timelines go to <dir>/<job_id>.json and the <dir>/timeline.db index
+forensic_cfg = {
+    'dir': 'forensic',
+    'stride': 5,
+    'batch': 8,
+    'workers': None,   # None: all cores
+    'segment_seconds': 60.0,
+}
+forensic_jobs = {}  # {job_id: status dict}
+forensic_ids = itertools.count(1)
+# Models load once per process and are kept across pipeline stop/start (model_registry.py).
+# With warm_up they load at boot on a background thread, including one dummy inference,
+# so the first /start_detection doesn't wait for them; pose_contexts MediaPipe graphs
+# are prebuilt and stopped pipelines hand theirs back for reuse.
+model_cfg = {
+    'warm_up': True,
+    'pose_contexts': 2,
+    'max_idle_pose_contexts': 16,
+}
+
+def load_detector():
+    detector = PersonWeaponDetector(person_model_path="yolov8n.pt", weapon_model_path="best.pt", **detector_cfg)
+    return warm_detector(detector, imgsz=inference_cfg['imgsz'], size=stream_cfg['size'])
+
+def get_inference_engine():
+    return models.get('inference_engine',
+                      lambda: BatchInferenceEngine(models.get('detector', load_detector), **inference_cfg))
+
+def get_pose_pool():
+    return models.get('pose_pool', lambda: PosePool(max_idle=model_cfg['max_idle_pose_contexts'])
+                      .warm(model_cfg['pose_contexts']))
+
+def warm_up_models():
+    # process mode loads its models inside the worker processes
+    if model_cfg['warm_up'] and execution_cfg['mode'] == 'threads':
+        models.warm_up(get_inference_engine, get_pose_pool)
+
+class CameraPipeline:
+    def __init__(self, camera_id, video_source, roi=None):
+        self.camera_id = camera_id
+        self.video_source = video_source
+        self.roi = RegionOfInterest(roi) if roi else None
+        self.broadcaster = FrameBroadcaster(**stream_cfg)
+        self.recorder = ClipRecorder(**clip_cfg)
+        self.grabber = FrameGrabber(video_source, **capture_cfg)
+        self.scheduler = AdaptiveScheduler(**scheduler_cfg)
+        self.state = None  # (active, level) last published on the event bus
+        self.stop_flag = False
+        self.thread = None
+
+    def start(self):
+        self.grabber.start()
+        self.thread = threading.Thread(target=start_detection_pipeline,
+                                       args=(self, alert_collector))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_flag = True
+        self.grabber.stop()
+        self.broadcaster.close()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def stats(self):
+        return {"capture": self.grabber.stats(), "scheduler": self.scheduler.stats(),
+                "recorder": self.recorder.stats()}
+
+class ProcessCameraPipeline(CameraPipeline):
+    """Same interface as CameraPipeline, but capture/detection/pose run in worker processes."""
+    def __init__(self, camera_id, video_source, roi=None):
+        self.camera_id = camera_id
+        self.video_source = video_source
+        self.broadcaster = FrameBroadcaster(**stream_cfg)
+        self.recorder = ClipRecorder(**clip_cfg)
+        self.workers = MultiprocessPipeline(
+            video_source, roi=roi,
+            detector_cfg=dict(detector_cfg, person_model_path="yolov8n.pt", weapon_model_path="best.pt"),
+            capture_cfg=capture_cfg, scheduler_cfg=scheduler_cfg,
+            imgsz=inference_cfg['imgsz'], conf=inference_cfg['conf'],
+            detect_workers=execution_cfg['detect_workers'])
+        self.state = None
+        self.stop_flag = False
+        self.thread = None
+
+    def start(self):
+        self.workers.start()
+        self.thread = threading.Thread(target=run_process_pipeline,
+                                       args=(self, alert_collector))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_flag = True
+        self.workers.stop_event.set()
+        self.broadcaster.close()
+
+    def stats(self):
+        return {"processes": self.workers.stats(), "recorder": self.recorder.stats()}
 
 class AlertCollector:
-    def __init__(self):
-        self.alerts = []
-        self.last_alert_times = {}  # {(level, tuple(reasons)): timestamp}
-
-    def add_alert(self, level, reasons, status="Sent", snapshot_path=None):
-        import time
-        key = (level, tuple(reasons))
-        now = time.time()
-        last_time = self.last_alert_times.get(key, 0)
-        if now - last_time < 30:
-            # Don't add duplicate alert within 30 seconds
-            return
-        self.last_alert_times[key] = now
-        self.alerts.append({
+    """
+    Alert history for the dashboard, persisted in an AlertStore (SQLite).
+    Duplicates are not filtered here: the DecisionEngine raises one alert per incident.
+    """
+    def __init__(self, store=None, events=None):
+        self.store = store or AlertStore()
+        self.events = events  # EventBus; every change is published as 'alert' / 'alert_update'
+        self.lock = threading.Lock()  # alert workers write delivery status back concurrently
+
+    def _publish(self, type, alert):
+        if self.events:
+            self.events.publish(type, dict(alert, delivery=dict(alert["delivery"])))
+
+    def add_alert(self, level, reasons, status="Sent", snapshot_path=None, camera_id=DEFAULT_CAMERA, incident=None):
+        alert = {
             "level": level,
             "reasons": reasons,
             "status": status,
-            "timestamp": now,
-            "snapshot_path": snapshot_path
-        })
-alert_collector = AlertCollector()
+            "timestamp": time.time(),
+            "incident": incident,
+            "snapshot_path": snapshot_path,
+            "camera_id": camera_id,
+            "delivery": {}  # {channel: 'queued' / 'sent' / 'failed' / 'skipped' / 'dropped'}
+        }
+        self.store.add(alert)
+        self._publish('alert', alert)
+        return alert
+
+    def set_status(self, alert, status):
+        alert["status"] = status
+        self.store.update(alert["id"], status=status)
+        self._publish('alert_update', alert)
+
+    def set_media(self, alert, snapshot_path, clip_path=None):
+        alert["snapshot_path"] = snapshot_path
+        alert["clip_path"] = clip_path
+        self.store.update(alert["id"], snapshot_path=snapshot_path, clip_path=clip_path)
+        self._publish('alert_update', alert)
+
+    def update_status(self, alert, channel, status):
+        # on_status callback for AlertManager.send
+        with self.lock:
+            alert["delivery"][channel] = status
+            states = alert["delivery"].values()
+            if 'queued' in states:
+                alert["status"] = "Sending"
+            elif 'failed' in states or 'dropped' in states:
+                alert["status"] = "Failed"
+            else:
+                alert["status"] = "Sent"
+            self.store.update(alert["id"], status=alert["status"], delivery=dict(alert["delivery"]))
+            self._publish('alert_update', alert)
+
+    def query(self, **kwargs):
+        return self.store.query(**kwargs)
+
+    def latest(self, camera_id=None):
+        return self.store.latest(camera_id)
 
 twilio_cfg = {
     'account_sid': '',
@@ -56,57 +289,69 @@ smtp_cfg = {
     'from': '',
     'to': ''
 }
-alert_manager = AlertManager(twilio_cfg=twilio_cfg, smtp_cfg=smtp_cfg)
-
-def generate_frames():
-    global frame_queue, stop_flag
-    frame_count = 0
-    import time
-    last_frame_time = time.time()
-    while not stop_flag:
-        if frame_queue and not frame_queue.empty():
-            frame = frame_queue.get()
-            frame_count += 1
-            # Stream only every 2nd frame for speed
-            if frame_count % 2 != 0:
-                continue
-            frame = cv2.resize(frame, (640, 360))
-            ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-            if ret:
-                frame_bytes = buffer.tobytes()
-                print(f"Streaming frame at {time.strftime('%H:%M:%S')}")
-                last_frame_time = time.time()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        else:
-            # If no frame available, send a blank image every 2 seconds
-            if time.time() - last_frame_time > 2:
-                import numpy as np
-                blank = np.zeros((360, 640, 3), dtype=np.uint8)
-                ret, buffer = cv2.imencode('.jpg', blank, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-                if ret:
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                last_frame_time = time.time()
+# Alert snapshots: encoded through the frame's JPEG cache, written off the detection thread
+# into snapshots/<date>/<camera>/ with a thumbnail each; the oldest are evicted past max_age_days or max_bytes (see snapshot_store.py)
+snapshot_cfg = {
+    'root': 'snapshots',
+    'max_bytes': 512 * 1024 * 1024,
+    'max_age_days': 30,
+    'quality': 85,
+    'max_width': 1280,
+    'thumb_width': 320,
+}
+
+def cache_snapshot(record, data):
+    # the bytes just written become /latest_alert_snapshot's in-memory copy
+    snapshot_cache.put(record['camera_id'], data, record['alert_id'], record['created'])
+
+# Set by create_app(). Nothing that starts threads or opens databases runs at import:
+# mp_pipeline/forensic workers use the spawn start method, which re-runs this file as
+# __mp_main__ in every worker process.
+alert_collector = None
+snapshot_store = None
+alert_manager = None
+forensic_runner = None
+
+def create_app():
+    """Starts the alert store, snapshot store, alert delivery and forensic job workers (once) and returns the app."""
+    global alert_collector, snapshot_store, alert_manager, forensic_runner
+    if alert_collector is None:
+        alert_collector = AlertCollector(events=events)
+        snapshot_store = SnapshotStore(on_saved=cache_snapshot, **snapshot_cfg)
+        alert_manager = AlertManager(twilio_cfg=twilio_cfg, smtp_cfg=smtp_cfg, snapshot_store=snapshot_store)
+        forensic_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="forensic")
+    return app
+
+def generate_frames(pipeline):
+    return pipeline.broadcaster.subscribe()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/video_feed')
-def video_feed():
-    if not pipeline_thread or not pipeline_thread.is_alive():
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id=DEFAULT_CAMERA):
+    pipeline = pipelines.get(secure_filename(camera_id))
+    if not pipeline or not pipeline.is_alive():
         # Detection not running, return empty response
         return Response(b'', mimetype='multipart/x-mixed-replace; boundary=frame')
-    return Response(generate_frames(),
+    return Response(generate_frames(pipeline),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/cameras')
+def cameras():
+    return jsonify([dict({"camera_id": cam_id, "source": p.video_source, "running": p.is_alive()}, **p.stats())
+                    for cam_id, p in pipelines.items()])
+
 @app.route('/start_detection', methods=['POST'])
 def start_detection():
-    global frame_queue, pipeline_thread, stop_flag
-    if pipeline_thread and pipeline_thread.is_alive():
-        return jsonify({"error": "Detection already running"}), 400
+    # camera_id ends up in snapshot filenames, so keep it path-safe
+    camera_id = secure_filename(request.form.get('camera_id') or '') or DEFAULT_CAMERA
+    with pipelines_lock:
+        existing = pipelines.get(camera_id)
+        if existing and existing.is_alive():
+            return jsonify({"error": f"Detection already running for camera {camera_id}"}), 400
     source_type = request.form.get('source_type')
     if source_type == 'file':
         if 'video' not in request.files:
@@ -123,73 +368,366 @@ def start_detection():
         if not rtsp_url:
             return jsonify({"error": "No RTSP URL provided"}), 400
         video_source = rtsp_url
-    stop_flag = False
-    frame_queue = Queue(maxsize=500)
-    pipeline_thread = threading.Thread(target=start_detection_pipeline, 
-                                    args=(video_source, frame_queue, alert_collector))
-    pipeline_thread.daemon = True
-    pipeline_thread.start()
-    return jsonify({"message": "Detection started"})
-
-def start_detection_pipeline(video_source, frame_queue, alert_collector):
-    print(f"[INFO] Starting detection pipeline with source: {video_source}")
-    detector = PersonWeaponDetector(person_model_path="yolov8n.pt", weapon_model_path="best.pt")
+    # roi: JSON {"keypad": [[x, y], ...], ...} in frame pixels; falls back to roi_cfg
+    roi = roi_cfg.get(camera_id)
+    if request.form.get('roi'):
+        try:
+            roi = json.loads(request.form['roi'])
+            RegionOfInterest(roi)
+        except (ValueError, TypeError, AttributeError):
+            return jsonify({"error": "Invalid roi; expected {name: [[x, y], ...]}"}), 400
+    with pipelines_lock:
+        existing = pipelines.get(camera_id)
+        if existing and existing.is_alive():
+            return jsonify({"error": f"Detection already running for camera {camera_id}"}), 400
+        pipeline_cls = ProcessCameraPipeline if execution_cfg['mode'] == 'processes' else CameraPipeline
+        pipeline = pipeline_cls(camera_id, video_source, roi=roi)
+        pipelines[camera_id] = pipeline
+        pipeline.start()
+    events.publish('camera', {"camera_id": camera_id, "running": True})
+    return jsonify({"message": "Detection started", "camera_id": camera_id})
+
+def start_detection_pipeline(pipeline, alert_collector):
+    camera_id = pipeline.camera_id
+    video_source = pipeline.video_source
+    log.info("starting pipeline camera=%s source=%s", camera_id, video_source)
+    # Models are shared across cameras; tamper/pose state is per camera.
+    engine = get_inference_engine()
+    detector = engine.detector
     tamper = TamperDetector()
-    action_detector = ActionDetector()
+    tracker = Tracker()
+    action_detector = ActionDetector(pose_pool=get_pose_pool())
     decision_engine = DecisionEngine()
-    alert_manager = AlertManager(twilio_cfg=twilio_cfg, smtp_cfg=smtp_cfg)
-    cap = cv2.VideoCapture(video_source)
-    if not cap.isOpened():
-        print(f"[ERROR] Could not open video source: {video_source}")
-        return
+    scheduler = pipeline.scheduler
+    roi = pipeline.roi
+    # decoding runs on the grabber's thread; we always get the newest frame
+    grabber = pipeline.grabber
+    timed = partial(registry.timer, 'stage_seconds', camera=camera_id)
     frame_idx = 0
-    while not stop_flag:
-        ret, frame = cap.read()
-        frame_idx += 1
-        if not ret:
-            print(f"[WARN] Frame not read at index {frame_idx}. End of stream or error.")
+    # one frame in flight per camera: lets the engine flush once every camera has submitted
+    engine.register()
+    try:
+        while not pipeline.stop_flag:
+            with timed(stage='read'):
+                frame = grabber.read(timeout=1.0)
+            if frame is None:
+                if grabber.finished:
+                    log.warning("end of stream camera=%s frames=%d", camera_id, frame_idx)
+                    break
+                continue
+            frame_idx += 1
+            log.debug("processing camera=%s frame=%d", camera_id, frame_idx)
+            t_frame = time.perf_counter()
+            with timed(stage='tamper'):
+                tamper_res = tamper.check(frame)
+            ran = scheduler.should_infer(frame)
+            if ran:
+                with timed(stage='detect'):
+                    # cost is the detector's own time for this frame, not the batching wait
+                    if roi:
+                        # only the ROI's bounding rectangle goes through the models
+                        sub, (dx, dy) = roi.crop(frame)
+                        if sub is None:
+                            objs, cost = [], 0.0
+                        else:
+                            objs, cost = engine.infer_timed(sub)
+                            objs = roi.filter(detector.shift(objs, dx, dy), frame.shape)
+                    else:
+                        objs, cost = engine.infer_timed(frame)
+                with timed(stage='track'):
+                    persons = tracker.update(detector.filter_by_class(objs, class_name='person'))
+                weapons = detector.filter_by_class(objs, class_name='weapon')
+            else:
+                # static scene / over budget: carry tracked persons forward, skip YOLO
+                with timed(stage='track'):
+                    persons = tracker.predict()
+                weapons = []
+            with timed(stage='action'):
+                action_res = action_detector.analyze(frame, persons)
+            decision = handle_frame(pipeline, alert_collector, decision_engine, frame, persons, weapons, tamper_res, action_res,
+                                    inferred=ran)
+            if ran:
+                scheduler.report(cost, persons=len(persons), score=decision.score)
+            registry.observe('frame_seconds', time.perf_counter() - t_frame, camera=camera_id)
+            registry.inc('frames_processed_total', camera=camera_id, inferred=ran)
+    finally:
+        engine.unregister()
+    grabber.stop()
+    action_detector.close()  # pose graphs go back to the shared pool for the next pipeline
+    pipeline.broadcaster.close()
+    pipeline.recorder.close()
+    events.publish('camera', {"camera_id": camera_id, "running": False})
+    log.info("pipeline stopped camera=%s frames=%d", camera_id, frame_idx)
+
+def run_process_pipeline(pipeline, alert_collector):
+    # capture, detection and pose run in pipeline.workers' processes; decisions,
+    # alerts and streaming stay here next to the Flask app
+    camera_id = pipeline.camera_id
+    log.info("starting process pipeline camera=%s source=%s", camera_id, pipeline.video_source)
+    decision_engine = DecisionEngine()
+    workers = pipeline.workers
+    frame_idx = 0
+    for frame, meta in workers.results():
+        if pipeline.stop_flag:
             break
-        print(f"[INFO] Processing frame {frame_idx}")
-        tamper_res = tamper.check(frame)
-        objs = detector.predict(frame, imgsz=320, conf=0.35)
-        persons = detector.filter_by_class(objs, class_name='person')
-        weapons = detector.filter_by_class(objs, class_name='weapon')
-        action_res = action_detector.analyze(frame, persons)
-        decision = decision_engine.evaluate(persons, weapons, tamper_res, action_res)
-        annotated = detector.annotate_frame(frame, persons, weapons, tamper_res, action_res)
-        if decision.raise_alert:
-            snap_path = alert_manager.save_snapshot(annotated, decision)
-            alert_collector.add_alert(decision.level, decision.reasons, snapshot_path=snap_path)
-            alert_manager.send(decision, annotated)
-        if frame_queue.full():
-            try:
-                frame_queue.get_nowait()
-            except Exception as e:
-                print(f"[WARN] Could not remove frame from full queue: {e}")
-        frame_queue.put(annotated)
-        print(f"[INFO] Frame {frame_idx} put into queue.")
-    cap.release()
-    print(f"[INFO] Detection pipeline stopped. Released video source.")
+        frame_idx += 1
+        log.debug("processing camera=%s frame=%d", camera_id, frame_idx)
+        # stages that ran in the worker processes report their durations in the metadata
+        for stage, seconds in meta['timings'].items():
+            registry.observe('stage_seconds', seconds, camera=camera_id, stage=stage)
+        decision = handle_frame(pipeline, alert_collector, decision_engine, frame, meta['persons'], meta['weapons'],
+                                meta['tamper'], meta['action'], inferred=meta['infer'])
+        if 'elapsed' in meta:
+            workers.report(meta['elapsed'], persons=len(meta['persons']), score=decision.score)
+        # capture to fully handled, across all processes
+        registry.observe('frame_seconds', time.time() - meta['ts'], camera=camera_id)
+        registry.inc('frames_processed_total', camera=camera_id, inferred=meta['infer'])
+    workers.stop()
+    pipeline.broadcaster.close()
+    pipeline.recorder.close()
+    events.publish('camera', {"camera_id": camera_id, "running": False})
+    log.info("process pipeline stopped camera=%s frames=%d", camera_id, frame_idx)
+
+def handle_frame(pipeline, alert_collector, decision_engine, frame, persons, weapons, tamper_res, action_res,
+                 inferred=True):
+    """Decision, annotation, alerting and streaming for one processed frame."""
+    camera_id = pipeline.camera_id
+    timed = partial(registry.timer, 'stage_seconds', camera=camera_id)
+    with timed(stage='decision'):
+        decision = decision_engine.evaluate(persons, weapons, tamper_res, action_res, inferred=inferred)
+    if (decision.active, decision.level) != pipeline.state:
+        # incident opened / escalated / closed: one event per change, not per frame
+        pipeline.state = (decision.active, decision.level)
+        events.publish('state', {"camera_id": camera_id, "active": decision.active, "level": decision.level,
+                                 "reasons": decision.reasons, "incident": decision.incident})
+    # overlays are drawn (once, in place) only if the stream or a snapshot needs pixels
+    annotated = AnnotatedFrame(frame, persons, weapons, tamper_res, action_res, owned=True)
+    with timed(stage='record'):
+        pipeline.recorder.add(annotated)
+    if decision.active:
+        # the clip's post-roll keeps extending while the incident is open
+        clip_path = pipeline.recorder.trigger(f"{camera_id}_{'_'.join(decision.reasons) or 'alert'}")
+    if decision.raise_alert:
+        registry.inc('alerts_total', camera=camera_id, level=decision.level)
+        with timed(stage='alert'):
+            # once when an incident opens, once more if it escalates to HIGH
+            alert = alert_collector.add_alert(decision.level, decision.reasons, status="Queued", camera_id=camera_id,
+                                              incident=decision.incident)
+            snap_path = alert_manager.save_snapshot(annotated, decision, camera_id=camera_id, alert_id=alert["id"])
+            alert_collector.set_media(alert, snap_path, clip_path)
+            on_status = partial(alert_collector.update_status, alert)
+            # only enqueues; SMS/email/call are delivered by AlertManager's dispatch workers
+            if not alert_manager.send(decision, annotated, camera_id=camera_id, on_status=on_status,
+                                      snapshot_path=snap_path):
+                alert_collector.set_status(alert, "Suppressed")
+    with timed(stage='stream'):
+        pipeline.broadcaster.publish(annotated)
+    return decision
+
+def update_gauges():
+    # sampled when /metrics or /stats is read, not on the per-frame path
+    for cam_id, p in list(pipelines.items()):
+        registry.set('pipeline_running', int(p.is_alive()), camera=cam_id)
+        registry.set('stream_subscribers', p.broadcaster.subscribers, camera=cam_id)
+        stats = p.stats()
+        source = stats.get('capture') or stats.get('processes')
+        registry.set('frames_dropped', source['dropped'], camera=cam_id)
+        if 'capture' in stats:
+            registry.set('decode_fps', stats['capture']['decode_fps'], camera=cam_id)
+            registry.set('stream_reconnects', stats['capture']['reconnects'], camera=cam_id)
+            registry.set('capture_buffered_frames', len(p.grabber.ring), camera=cam_id)
+        if 'scheduler' in stats:
+            registry.set('inference_interval_seconds', stats['scheduler']['interval'], camera=cam_id)
+        registry.set('clip_buffer_bytes', stats['recorder']['buffered_bytes'], camera=cam_id)
+    if models.loaded('inference_engine'):
+        registry.set('inference_queue_depth', get_inference_engine().requests.qsize())
+    for channel, q in alert_manager.dispatcher.queues.items():
+        registry.set('alert_queue_depth', q.qsize(), channel=channel)
+    registry.set('alert_store_pending_writes', alert_collector.store.pending.qsize())
+    snaps = snapshot_store.stats()
+    registry.set('snapshot_store_bytes', snaps['bytes'])
+    registry.set('snapshot_queue_depth', snaps['queued'])
+
+@app.route('/metrics')
+def metrics():
+    update_gauges()
+    return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stats')
+def stats():
+    update_gauges()
+    return jsonify(dict(registry.snapshot(), models=models.stats()))
 
 @app.route('/latest_alert_snapshot')
-def latest_alert_snapshot():
-    # Return the latest alert snapshot image
-    if not alert_collector.alerts:
+@app.route('/latest_alert_snapshot/<camera_id>')
+def latest_alert_snapshot(camera_id=None):
+    # Return the latest alert snapshot image; answered from memory, 304 if the client has it
+    entry = snapshot_cache.get(camera_id)
+    if entry is None:
+        # nothing alerted since start-up: load the stored latest once
+        latest = alert_collector.latest(camera_id)
+        snap_path = latest and latest.get('snapshot_path')
+        if not snap_path or not os.path.exists(snap_path):
+            return '', 404
+        with open(snap_path, 'rb') as f:
+            entry = snapshot_cache.put(latest['camera_id'], f.read(), latest['id'], latest['timestamp'])
+    data, etag, modified = entry
+    resp = Response(data, mimetype='image/jpeg')
+    resp.set_etag(etag)
+    resp.last_modified = modified
+    resp.cache_control.no_cache = True  # revalidate every time; usually a 304
+    return resp.make_conditional(request)
+
+@app.route('/events')
+@app.route('/events/<camera_id>')
+def event_stream(camera_id=None):
+    # Server-Sent Events: 'alert', 'alert_update', 'state' (incident changes), 'camera'
+    # (started/stopped) and 'reset' (cursor too old: refetch /get_alerts). Browsers resume
+    # from Last-Event-ID on reconnect; ?cursor=<id> does the same explicitly.
+    cursor = request.headers.get('Last-Event-ID', type=int)
+    if cursor is None:
+        cursor = request.args.get('cursor', type=int)
+    accept = (lambda e: e['data'].get('camera_id') == camera_id) if camera_id else None
+    return Response(events.stream(cursor, accept), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/alert_snapshot/<int:alert_id>')
+def alert_snapshot(alert_id):
+    # ?thumb=1 for the dashboard-sized thumbnail; 404 once retention has evicted it
+    alert = alert_collector.store.get(alert_id)
+    path = alert and alert.get('snapshot_path')
+    if path and request.args.get('thumb', type=int):
+        path = SnapshotStore.thumb_path(path)
+    if not path or not snapshot_store.wait(path, timeout=2.0):
+        return '', 404
+    return send_file(os.path.abspath(path), mimetype='image/jpeg', max_age=3600)
+
+@app.route('/snapshots')
+@app.route('/snapshots/<camera_id>')
+def list_snapshots(camera_id=None):
+    # from the snapshot index, newest first; ?before=<id> for older pages
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify(snapshot_store.list(camera_id=camera_id, before=request.args.get('before', type=int),
+                                       limit=limit))
+
+@app.route('/alert_clip/<int:alert_id>')
+def alert_clip(alert_id):
+    # the clip is written once its post-roll has been recorded
+    alert = alert_collector.store.get(alert_id)
+    clip_path = alert and alert.get('clip_path')
+    if not clip_path or not os.path.exists(clip_path):
+        return '', 404
+    return send_file(os.path.abspath(clip_path), mimetype='video/mp4')
+
+def run_forensic_scan(job):
+    job['status'] = 'running'
+    job['started'] = time.time()
+
+    def progress(done, total):
+        job['progress'] = round(done / total, 3) if total else None
+
+    try:
+        timeline = forensic.scan_video(
+            job['source'], stride=job['stride'], batch=forensic_cfg['batch'], workers=forensic_cfg['workers'],
+            segment_seconds=forensic_cfg['segment_seconds'], max_width=capture_cfg['max_width'],
+            imgsz=inference_cfg['imgsz'], conf=inference_cfg['conf'],
+            detector_cfg=dict(detector_cfg, person_model_path="yolov8n.pt", weapon_model_path="best.pt"),
+            progress=progress)
+        os.makedirs(forensic_cfg['dir'], exist_ok=True)
+        job['timeline_path'] = os.path.join(forensic_cfg['dir'], f"{job['id']}.json")
+        forensic.write_json(timeline, job['timeline_path'])
+        forensic.write_sqlite(timeline, f"sqlite:///{os.path.join(forensic_cfg['dir'], 'timeline.db')}")
+        job.update(status='done', progress=1.0, duration=timeline['duration'], elapsed=timeline['elapsed'],
+                   incidents=timeline['incidents'])
+    except Exception as e:
+        log.exception("forensic scan failed job=%s", job['id'])
+        job.update(status='failed', error=str(e))
+    events.publish('forensic', {k: v for k, v in job.items() if k != 'incidents'})
+
+@app.route('/forensic_scan', methods=['POST'])
+def start_forensic_scan():
+    # an uploaded 'video' file, or 'filename' of a file already in uploads/; optional 'stride'
+    if 'video' in request.files and request.files['video'].filename:
+        video_file = request.files['video']
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(video_file.filename))
+        video_file.save(filepath)
+    else:
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(request.form.get('filename') or ''))
+        if not os.path.isfile(filepath):
+            return jsonify({"error": "No video file provided"}), 400
+    job_id = next(forensic_ids)
+    job = forensic_jobs[job_id] = {
+        'id': job_id,
+        'source': filepath,
+        'stride': max(1, request.form.get('stride', forensic_cfg['stride'], type=int)),
+        'status': 'queued',
+        'progress': 0.0,
+    }
+    forensic_runner.submit(run_forensic_scan, job)
+    return jsonify({"message": "Scan queued", "job_id": job_id}), 202
+
+@app.route('/forensic_scan/<int:job_id>')
+def forensic_scan_status(job_id):
+    job = forensic_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
+@app.route('/forensic_scan/<int:job_id>/timeline')
+def forensic_scan_timeline(job_id):
+    job = forensic_jobs.get(job_id)
+    if not job or job['status'] != 'done':
         return '', 404
-    snap_path = alert_collector.alerts[-1].get('snapshot_path')
-    if not snap_path or not os.path.exists(snap_path):
+    return send_file(os.path.abspath(job['timeline_path']), mimetype='application/json')
+
+@app.route('/forensic_scan/<int:job_id>/frame')
+def forensic_scan_frame(job_id):
+    # ?t=<seconds> from the timeline: the source frame at that point, as JPEG
+    job = forensic_jobs.get(job_id)
+    t = request.args.get('t', type=float)
+    if not job or t is None:
+        return '', 404
+    cap = cv2.VideoCapture(job['source'])
+    cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+    ok, frame = cap.read()
+    cap.release()
+    if not ok:
         return '', 404
-    return Response(open(snap_path, 'rb').read(), mimetype='image/jpeg')
+    return Response(cv2.imencode('.jpg', frame)[1].tobytes(), mimetype='image/jpeg')
 
 @app.route('/stop_detection', methods=['POST'])
 def stop_detection():
-    global stop_flag
-    stop_flag = True
+    # Stop a single camera when camera_id is given, otherwise every pipeline
+    camera_id = request.form.get('camera_id')
+    if camera_id:
+        # same normalisation as start_detection, which keys pipelines by the path-safe id
+        camera_id = secure_filename(camera_id) or DEFAULT_CAMERA
+    with pipelines_lock:
+        if camera_id:
+            if camera_id not in pipelines:
+                return jsonify({"error": f"Unknown camera {camera_id}"}), 404
+            pipelines[camera_id].stop()
+        else:
+            for p in pipelines.values():
+                p.stop()
     return jsonify({"message": "Detection stopped"})
 
 @app.route('/get_alerts')
-def get_alerts():
-    return jsonify(alert_collector.alerts)
+@app.route('/get_alerts/<camera_id>')
+def get_alerts(camera_id=None):
+    # ?limit=N (max 500), ?before=<id> for older pages, ?since=<id> for new alerts only,
+    # ?level=HIGH|SUSPICIOUS; results are oldest first
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify(alert_collector.query(camera_id=camera_id,
+                                         level=request.args.get('level'),
+                                         since=request.args.get('since', type=int),
+                                         before=request.args.get('before', type=int),
+                                         limit=limit))
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000, threaded=True)
\ No newline at end of file
+    debug = True
+    # the debug reloader re-runs this file in a child process; only that one serves requests
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up_models()
+        create_app()
+    app.run(debug=debug, port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import shutil
+import numpy as np
+import cv2
+
+log = logging.getLogger(__name__)
+
+# Every backend returns, for each input frame, a tuple of arrays
+# (boxes Nx4 xyxy in frame pixels, scores N, classes N) so that
+# PersonWeaponDetector does not care which runtime produced them.
+
+
+class UltralyticsBackend:
+    def __init__(self, model_path, device='cpu'):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.device = device
+
+    def run(self, frames, imgsz=320, conf=0.35):
+        out = []
+        for r in self.model(frames, imgsz=imgsz, conf=conf, device=self.device):
+            b = r.boxes
+            out.append((b.xyxy.cpu().numpy(), b.conf.cpu().numpy(), b.cls.cpu().numpy().astype(int)))
+        return out
+
+
+def export_onnx(model_path, imgsz=320, int8=False, cache_dir='model_cache'):
+    """
+    Export a YOLO .pt file to ONNX once and cache it on disk.
+    The cached file is reused until the source weights change.
+    returns: path of the cached .onnx file
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    cached = os.path.join(cache_dir, f"{stem}_{imgsz}{'_int8' if int8 else ''}.onnx")
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(model_path):
+        return cached
+    log.info("exporting %s to ONNX (%s)", model_path, cached)
+    fp32 = os.path.join(cache_dir, f"{stem}_{imgsz}.onnx")
+    if not os.path.exists(fp32) or os.path.getmtime(fp32) < os.path.getmtime(model_path):
+        from ultralytics import YOLO
+        exported = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        shutil.move(exported, fp32)
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32, cached, weight_type=QuantType.QUInt8)
+    return cached
+
+
+class OnnxBackend:
+    """
+    Runs an exported YOLOv8 ONNX graph through ONNX Runtime.
+    providers can include 'OpenVINOExecutionProvider' when onnxruntime-openvino is installed.
+    """
+    def __init__(self, model_path, imgsz=320, int8=False, threads=None, providers=None,
+                 cache_dir='model_cache', iou=0.7):
+        import onnxruntime as ort
+        if model_path.endswith('.pt'):
+            model_path = export_onnx(model_path, imgsz=imgsz, int8=int8, cache_dir=cache_dir)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=opts,
+                                            providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.iou = iou
+
+    def _letterbox(self, frame, imgsz):
+        h, w = frame.shape[:2]
+        r = min(imgsz / h, imgsz / w)
+        nh, nw = int(round(h * r)), int(round(w * r))
+        pad_y, pad_x = (imgsz - nh) // 2, (imgsz - nw) // 2
+        canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+        canvas[pad_y:pad_y + nh, pad_x:pad_x + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        return canvas, r, pad_x, pad_y
+
+    def run(self, frames, imgsz=320, conf=0.35):
+        boxed = [self._letterbox(f, imgsz) for f in frames]
+        # BGR HWC uint8 -> RGB NCHW float
+        blob = np.stack([b[0] for b in boxed])[..., ::-1].transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+        preds = self.session.run(None, {self.input_name: blob})[0]  # (B, 4+nc, anchors)
+        out = []
+        for frame, (_, r, pad_x, pad_y), pred in zip(frames, boxed, preds):
+            pred = pred.T
+            cls_scores = pred[:, 4:]
+            classes = cls_scores.argmax(1)
+            scores = cls_scores[np.arange(len(classes)), classes]
+            keep = scores >= conf
+            cxcywh, scores, classes = pred[keep, :4], scores[keep], classes[keep]
+            boxes = np.empty_like(cxcywh)
+            boxes[:, 0] = cxcywh[:, 0] - cxcywh[:, 2] / 2
+            boxes[:, 1] = cxcywh[:, 1] - cxcywh[:, 3] / 2
+            boxes[:, 2] = cxcywh[:, 0] + cxcywh[:, 2] / 2
+            boxes[:, 3] = cxcywh[:, 1] + cxcywh[:, 3] / 2
+            if len(boxes):
+                # class-aware NMS, same as ultralytics' default
+                xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+                idx = cv2.dnn.NMSBoxesBatched(xywh.tolist(), scores.tolist(), classes.tolist(), conf, self.iou)
+                idx = np.asarray(idx, dtype=int).reshape(-1)
+                boxes, scores, classes = boxes[idx], scores[idx], classes[idx]
+            # undo letterbox
+            boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / r
+            boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / r
+            h, w = frame.shape[:2]
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+            out.append((boxes, scores, classes))
+        return out
+
+
+class StubBackend:
+    """
+    Model-free stand-in for benchmarks and CI: a few boxes drifting slowly across the
+    frame (so tracking behaves realistically), after sleeping `latency` seconds per
+    frame to mimic inference cost. Deterministic for a given seed.
+    """
+    def __init__(self, model_path=None, latency=0.0, max_dets=2, seed=0):
+        self.latency = latency
+        self.max_dets = max_dets
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+
+    def run(self, frames, imgsz=320, conf=0.35):
+        out = []
+        for frame in frames:
+            if self.latency:
+                time.sleep(self.latency)
+            self.calls += 1
+            h, w = frame.shape[:2]
+            n = int(self.rng.integers(0, self.max_dets + 1))
+            i = np.arange(n)
+            cx = (w * (0.25 + 0.5 * i / max(n, 1)) + 2 * self.calls) % w
+            cy = np.full(n, h / 2)
+            bw, bh = w / 8, h / 3
+            boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1).clip(0, [w, h, w, h])
+            scores = self.rng.uniform(conf, 1.0, n)
+            out.append((boxes.astype(np.float32), scores.astype(np.float32), np.zeros(n, dtype=int)))
+        return out
+
+
+def make_backend(model_path, backend='ultralytics', device='cpu', **backend_cfg):
+    if backend == 'ultralytics':
+        return UltralyticsBackend(model_path, device=device)
+    if backend == 'onnx':
+        return OnnxBackend(model_path, **backend_cfg)
+    if backend == 'stub':
+        return StubBackend(model_path, **backend_cfg)
+    raise ValueError(f"Unknown inference backend: {backend}")
@@ -0,0 +1,254 @@
+"""
+Replay benchmark for the detection pipeline.
+
+Frames are loaded into memory first (so disk/decode speed doesn't skew the numbers),
+then pushed through tamper -> detect -> track -> action -> decision -> annotate ->
+encode. 'e2e' times every stage inside one end-to-end loop; 'isolated' replays the
+recorded inputs of each stage through a fresh instance of that stage alone.
+Decisions run on the video's own clock, so cues confirm as they would live.
+Reports FPS, p50/p95/p99 latency per stage and the pipeline's peak RSS on top of
+the loaded frames.
+
+    python benchmark.py --source uploads/test.mp4 --frames 300
+    python benchmark.py --stub --frames 200 --json bench.json   # no model weights / GPU needed
+"""
+import argparse
+import json
+import sys
+import time
+import resource
+from collections import defaultdict
+from types import SimpleNamespace
+import numpy as np
+import cv2
+
+from tamper import TamperDetector
+from detectors import PersonWeaponDetector
+from backends import make_backend
+from tracker import Tracker
+from action_detector import ActionDetector
+from decision import DecisionEngine
+from frames import AnnotatedFrame
+
+STAGES = ('tamper', 'detect', 'track', 'action', 'decision', 'annotate', 'encode')
+
+
+class _StubPose:
+    """Stand-in for a MediaPipe Pose context: finds nothing after `latency` seconds."""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def process(self, rgb):
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(pose_landmarks=None)
+
+    def close(self):
+        pass
+
+
+class StageTimer:
+    def __init__(self, warmup=0):
+        self.warmup = warmup
+        self.samples = defaultdict(list)
+        self.calls = defaultdict(int)
+
+    def timed(self, stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - t0
+        self.calls[stage] += 1
+        if self.calls[stage] > self.warmup:
+            self.samples[stage].append(elapsed)
+        return out
+
+    def summary(self):
+        out = {}
+        for stage in STAGES + ('total',):
+            s = np.asarray(self.samples.get(stage, []))
+            if not len(s):
+                continue
+            p50, p95, p99 = np.percentile(s, [50, 95, 99]) * 1000
+            out[stage] = {
+                'n': len(s),
+                'fps': round(len(s) / s.sum(), 1) if s.sum() > 0 else None,
+                'mean_ms': round(float(s.mean()) * 1000, 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+            }
+        return out
+
+
+def synthetic_frames(n, size=(1280, 720), seed=0):
+    """Textured background with a few moving blocks, enough for tamper/motion to behave."""
+    w, h = size
+    rng = np.random.default_rng(seed)
+    bg = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (0, 0), 3)
+    frames = []
+    for i in range(n):
+        f = bg.copy()
+        for k in range(3):
+            x = int((i * (4 + k) + k * w // 3) % (w - w // 10))
+            y = h // 3 + k * h // 10
+            cv2.rectangle(f, (x, y), (x + w // 10, y + h // 4), (40 * k, 200, 255 - 60 * k), -1)
+        frames.append(f)
+    return frames
+
+
+def load_frames(source, n, max_width=None):
+    """(frames, fps); fps gives the frames their video timestamps."""
+    if source == 'synthetic':
+        return synthetic_frames(n), 25.0
+    cap = cv2.VideoCapture(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames = []
+    while len(frames) < n:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if max_width and frame.shape[1] > max_width:
+            frame = cv2.resize(frame, (max_width, int(frame.shape[0] * max_width / frame.shape[1])),
+                               interpolation=cv2.INTER_AREA)
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Could not read any frames from {source}")
+    return frames, fps
+
+
+def build(args):
+    if args.stub:
+        detector = PersonWeaponDetector(backend='stub', backend_cfg={'latency': args.stub_latency, 'seed': 0})
+        # with the person stub's seed every weapon box would sit on a person box and be suppressed
+        detector.weapon_model = make_backend(None, backend='stub', latency=args.stub_latency, seed=1)
+        action = ActionDetector(pose_factory=lambda: _StubPose(args.pose_latency))
+    else:
+        detector = PersonWeaponDetector(person_model_path=args.person_model, weapon_model_path=args.weapon_model,
+                                        device=args.device, backend=args.backend)
+        action = ActionDetector()
+    return SimpleNamespace(tamper=TamperDetector(), detector=detector, tracker=Tracker(), action=action,
+                           decision=DecisionEngine())
+
+
+def run_e2e(frames, fps, args, p):
+    timer = StageTimer(args.warmup)
+    records = []
+    t_start = None
+    for i, frame in enumerate(frames):
+        if i == args.warmup:
+            t_start = time.perf_counter()
+        t0 = time.perf_counter()
+        tamper_res = timer.timed('tamper', p.tamper.check, frame)
+        objs = timer.timed('detect', p.detector.predict, frame, imgsz=args.imgsz, conf=args.conf, as_arrays=True)
+        raw = p.detector.filter_by_class(objs, class_name='person')
+        weapons = p.detector.filter_by_class(objs, class_name='weapon')
+        persons = timer.timed('track', p.tracker.update, raw)
+        action_res = timer.timed('action', p.action.analyze, frame, persons)
+        decision = timer.timed('decision', p.decision.evaluate, persons, weapons, tamper_res, action_res,
+                               now=i / fps)
+        out = AnnotatedFrame(frame, persons, weapons, tamper_res, action_res)
+        timer.timed('annotate', lambda: out.annotated)
+        timer.timed('encode', out.jpeg, args.quality, args.stream_size)
+        elapsed = time.perf_counter() - t0
+        timer.calls['total'] += 1
+        if i >= args.warmup:
+            timer.samples['total'].append(elapsed)
+        records.append((raw, persons, weapons, tamper_res, action_res, decision.raise_alert))
+    wall = time.perf_counter() - t_start if t_start else 0.0
+    return timer, wall, records
+
+
+def run_isolated(frames, fps, records, args):
+    timer = StageTimer(args.warmup)
+    p = build(args)
+    for frame in frames:
+        timer.timed('tamper', p.tamper.check, frame)
+    for frame in frames:
+        timer.timed('detect', p.detector.predict, frame, imgsz=args.imgsz, conf=args.conf, as_arrays=True)
+    for raw, *_ in records:
+        timer.timed('track', p.tracker.update, raw)
+    for frame, (_, persons, *_) in zip(frames, records):
+        timer.timed('action', p.action.analyze, frame, persons)
+    for i, (_, persons, weapons, tamper_res, action_res, _) in enumerate(records):
+        timer.timed('decision', p.decision.evaluate, persons, weapons, tamper_res, action_res, now=i / fps)
+    for frame, (_, persons, weapons, tamper_res, action_res, _) in zip(frames, records):
+        out = AnnotatedFrame(frame, persons, weapons, tamper_res, action_res)
+        timer.timed('annotate', lambda: out.annotated)
+        timer.timed('encode', out.jpeg, args.quality, args.stream_size)
+    return timer
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def print_table(title, summary):
+    print(f"\n{title}")
+    print(f"  {'stage':<10}{'n':>6}{'fps':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, s in summary.items():
+        print(f"  {stage:<10}{s['n']:>6}{s['fps'] or 0:>10}{s['mean_ms']:>10}{s['p50_ms']:>10}"
+              f"{s['p95_ms']:>10}{s['p99_ms']:>10}")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--source', default='synthetic', help="video file, or 'synthetic'")
+    ap.add_argument('--frames', type=int, default=300)
+    ap.add_argument('--warmup', type=int, default=10, help="leading frames left out of the statistics")
+    ap.add_argument('--max-width', type=int, default=1280)
+    ap.add_argument('--mode', choices=('e2e', 'isolated', 'both'), default='both')
+    ap.add_argument('--stub', action='store_true', help="replace YOLO and MediaPipe with stubs")
+    ap.add_argument('--stub-latency', type=float, default=0.0, help="seconds per frame per stub model")
+    ap.add_argument('--pose-latency', type=float, default=0.0, help="seconds per stub pose call")
+    ap.add_argument('--person-model', default='yolov8n.pt')
+    ap.add_argument('--weapon-model', default='best.pt')
+    ap.add_argument('--backend', default='ultralytics')
+    ap.add_argument('--device', default='cpu')
+    ap.add_argument('--imgsz', type=int, default=320)
+    ap.add_argument('--conf', type=float, default=0.35)
+    ap.add_argument('--quality', type=int, default=70)
+    ap.add_argument('--stream-size', type=lambda s: tuple(int(v) for v in s.split('x')), default=(640, 360))
+    ap.add_argument('--json', help="also write the report to this file")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    frames, fps = load_frames(args.source, args.frames, args.max_width)
+    # the frame buffer is most of the process; measure the pipeline on top of it
+    loaded_rss = peak_rss_mb()
+    args.warmup = min(args.warmup, len(frames) - 1)
+    h, w = frames[0].shape[:2]
+    print(f"[INFO] {len(frames)} frames of {w}x{h} from {args.source}{' (stub models)' if args.stub else ''}")
+    p = build(args)
+    timer, wall, records = run_e2e(frames, fps, args, p)
+    report = {
+        'source': args.source,
+        'frames': len(frames),
+        'resolution': [w, h],
+        'stub': args.stub,
+        'alerts': sum(r[-1] for r in records),
+    }
+    if args.mode in ('e2e', 'both'):
+        report['e2e'] = timer.summary()
+        report['e2e_fps'] = round((len(frames) - args.warmup) / wall, 1) if wall else None
+        print_table(f"End to end: {report['e2e_fps']} FPS", report['e2e'])
+    if args.mode in ('isolated', 'both'):
+        report['isolated'] = run_isolated(frames, fps, records, args).summary()
+        print_table("Stages in isolation", report['isolated'])
+    report['frames_mb'] = round(sum(f.nbytes for f in frames) / (1024 * 1024), 1)
+    report['peak_rss_mb'] = peak_rss_mb()
+    report['pipeline_rss_mb'] = round(report['peak_rss_mb'] - loaded_rss, 1)
+    print(f"\nPeak RSS: {report['pipeline_rss_mb']} MB above the loaded frames "
+          f"({report['peak_rss_mb']} MB total, frames {report['frames_mb']} MB)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+import cv2
+
+log = logging.getLogger(__name__)
+
+
+class FrameGrabber:
+    """
+    Reads a video source on its own thread so decoding never waits for inference.
+    Only the newest `ring_size` frames are kept (1 = latest-frame semantics); frames
+    overwritten before anyone read them, or older than `max_age` seconds when read,
+    are counted as dropped. Live streams are reopened with exponential backoff when
+    they fail; files end at EOF (or loop) and are paced to their own FPS when `realtime`.
+    """
+    def __init__(self, src, ring_size=1, max_age=None, max_width=None, realtime=True, loop=False,
+                 hw_accel=False, api_preference=cv2.CAP_ANY, backoff=0.5, max_backoff=30.0):
+        self.src = src
+        self.is_file = isinstance(src, str) and os.path.exists(src)
+        self.max_age = max_age
+        self.max_width = max_width    # downscale wider frames right after decode
+        self.realtime = realtime
+        self.loop = loop
+        self.hw_accel = hw_accel
+        self.api_preference = api_preference
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.ring = deque(maxlen=ring_size)   # (timestamp, frame)
+        self.cond = threading.Condition()
+        self.ended = False
+        self.stopped = False
+        self.connected = False
+        self.frames = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.decode_fps = 0.0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        with self.cond:
+            self.cond.notify_all()
+
+    def _open(self):
+        params = []
+        if self.hw_accel and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            # let OpenCV pick whatever decoder acceleration the platform offers
+            params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        cap = cv2.VideoCapture(self.src, self.api_preference, params) if params else cv2.VideoCapture(self.src, self.api_preference)
+        if cap.isOpened() and not self.is_file:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # don't let the backend queue stale frames
+        return cap
+
+    def _run(self):
+        delay = self.backoff
+        while not self.stopped:
+            cap = self._open()
+            if not cap.isOpened():
+                cap.release()
+                if self.is_file:
+                    log.error("could not open video source %s", self.src)
+                    break
+                log.warning("could not open %s; retrying in %.1fs", self.src, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            self.connected = True
+            delay = self.backoff
+            interval = 0.0
+            if self.is_file and self.realtime:
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                interval = 1.0 / fps if fps and fps > 0 else 0.0
+            self._read_loop(cap, interval)
+            cap.release()
+            self.connected = False
+            if self.stopped or (self.is_file and not self.loop):
+                break
+            if not self.is_file:
+                self.reconnects += 1
+                log.warning("stream %s lost; reconnecting in %.1fs", self.src, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        with self.cond:
+            self.ended = True
+            self.cond.notify_all()
+
+    def _read_loop(self, cap, interval):
+        next_due = time.monotonic()
+        last = time.monotonic()
+        while not self.stopped:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            now = time.monotonic()
+            if self.max_width and frame.shape[1] > self.max_width:
+                h = int(frame.shape[0] * self.max_width / frame.shape[1])
+                frame = cv2.resize(frame, (self.max_width, h), interpolation=cv2.INTER_AREA)
+            self.frames += 1
+            dt = now - last
+            last = now
+            if dt > 0:
+                self.decode_fps = 0.9 * self.decode_fps + 0.1 / dt if self.decode_fps else 1.0 / dt
+            with self.cond:
+                if len(self.ring) == self.ring.maxlen:
+                    self.dropped += 1
+                self.ring.append((now, frame))
+                self.cond.notify_all()
+            if interval:
+                next_due += interval
+                sleep = next_due - time.monotonic()
+                if sleep > 0:
+                    time.sleep(sleep)
+                else:
+                    next_due = time.monotonic()
+
+    def read(self, timeout=1.0):
+        """Oldest buffered frame within max_age, or None on timeout / end of source."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                while self.ring:
+                    ts, frame = self.ring.popleft()
+                    if self.max_age is None or time.monotonic() - ts <= self.max_age:
+                        return frame
+                    self.dropped += 1
+                remaining = deadline - time.monotonic()
+                if self.ended or self.stopped or remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+    @property
+    def finished(self):
+        """True once the source has ended and every buffered frame was consumed."""
+        return self.ended and not self.ring
+
+    def stats(self):
+        return {
+            'connected': self.connected,
+            'decode_fps': round(self.decode_fps, 1),
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'reconnects': self.reconnects,
+        }
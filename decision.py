@@ -1,26 +1,111 @@
+import math
+import time
 from types import SimpleNamespace
 
 class DecisionEngine:
-    def __init__(self):
-        self.threshold_high = 2.0
+    """
+    Stateful incident engine for one camera.
+    Every cue (weapon, tamper, crowding, loitering, and per-track actions such as
+    violent_motion) feeds an exponentially decayed score with the given half-life.
+    A cue is confirmed once its score reaches `confirm` of its weight, i.e. after it
+    has persisted for about a half-life, so a one-frame false positive never counts.
+    An incident opens when the weights of confirmed cues add up to open_thresh and is
+    HIGH from threshold_high; it closes only after the decayed total has stayed below
+    close_thresh for close_hold seconds (hysteresis). raise_alert is True once when an
+    incident opens and once more if it escalates to HIGH; `active` stays True while open.
+    Detector-based cues (DETECTION_CUES) only change on frames where inference ran;
+    on skipped frames (inferred=False) the last detector result is held.
+    """
+    weights = {
+        'multiple_persons': 1.0,
+        'weapon_detected': 2.0,
+        'camera_tamper': 2.0,
+        'loitering': 0.8,
+        'violent_motion': 1.5,
+        'possible_faint': 1.5,
+    }
+    DETECTION_CUES = ('multiple_persons', 'weapon_detected')
 
-    def evaluate(self, persons, weapons, tamper_res, action_res):
-        score = 0.0
-        reasons = []
+    def __init__(self, half_life=0.5, confirm=0.5, open_thresh=1.2, threshold_high=2.0, close_thresh=0.5,
+                 close_hold=5.0, max_dt=1.0):
+        self.half_life = half_life
+        self.confirm = confirm
+        self.open_thresh = open_thresh      # above a single crowding or loitering cue on its own
+        self.threshold_high = threshold_high
+        self.close_thresh = close_thresh
+        self.close_hold = close_hold
+        self.max_dt = max_dt                # cap on the step after a stall, so cues can't jump in one frame
+        self.scores = {}                    # {(reason, track_id or None): decayed score}
+        self.last_time = None
+        self.incident = None                # {'id', 'level', 'opened', 'reasons', 'peak', 'quiet_since'}
+        self.incident_count = 0
+        self.detected = set()               # detector-based cues as of the last inferred frame
+
+    def _cues(self, persons, weapons, tamper_res, action_res):
+        cues = set()
         if len(persons) > 1:
-            score += 1.0; reasons.append('multiple_persons')
-        if weapons and len(weapons) > 0:
-            score += 2.0; reasons.append('weapon_detected')
+            cues.add(('multiple_persons', None))
+        if weapons is not None and len(weapons) > 0:
+            cues.add(('weapon_detected', None))
         if tamper_res.get('covered'):
-            score += 2.0; reasons.append('camera_tamper')
+            cues.add(('camera_tamper', None))
         if action_res.get('loitering'):
-            score += 0.8; reasons.append('loitering')
+            cues.add(('loitering', None))
         for a in action_res.get('actions', []):
-            if a.get('type') in ('violent_motion','possible_faint'):
-                score += 1.5; reasons.append(a.get('type'))
-        if score >= self.threshold_high:
-            return SimpleNamespace(raise_alert=True, level='HIGH', reasons=reasons)
-        elif score > 0:
-            return SimpleNamespace(raise_alert=True, level='SUSPICIOUS', reasons=reasons)
+            if a.get('type') in ('violent_motion', 'possible_faint'):
+                cues.add((a['type'], a.get('id')))
+        return cues
+
+    def evaluate(self, persons, weapons, tamper_res, action_res, now=None, inferred=True):
+        now = time.monotonic() if now is None else now
+        dt = 1 / 25 if self.last_time is None else min(max(now - self.last_time, 0.0), self.max_dt)
+        self.last_time = now
+        decay = math.pow(0.5, dt / self.half_life)
+        cues = self._cues(persons, weapons, tamper_res, action_res)
+        if inferred:
+            self.detected = {k for k in cues if k[0] in self.DETECTION_CUES}
         else:
-            return SimpleNamespace(raise_alert=False, level='NORMAL', reasons=[])
+            # skipped frame: no weapons were looked for, so don't let their score decay
+            cues = {k for k in cues if k[0] not in self.DETECTION_CUES} | self.detected
+        for key in cues | set(self.scores):
+            target = self.weights[key[0]] if key in cues else 0.0
+            self.scores[key] = self.scores.get(key, 0.0) * decay + target * (1 - decay)
+        # forget cues (e.g. tracks that left) once they have decayed away
+        self.scores = {k: s for k, s in self.scores.items() if s > 1e-3}
+        by_reason = {}
+        for (reason, _), s in self.scores.items():
+            by_reason[reason] = max(by_reason.get(reason, 0.0), s)
+        score = sum(by_reason.values())
+        reasons = sorted((r for r, s in by_reason.items() if s >= self.confirm * self.weights[r]),
+                         key=lambda r: -self.weights[r])
+        confirmed = sum(self.weights[r] for r in reasons)
+        level = 'HIGH' if confirmed >= self.threshold_high else 'SUSPICIOUS'
+
+        event = None
+        inc = self.incident
+        if inc is None:
+            if confirmed >= self.open_thresh:
+                self.incident_count += 1
+                inc = self.incident = {'id': self.incident_count, 'level': level, 'opened': time.time(),
+                                       'reasons': list(reasons), 'peak': score, 'quiet_since': None}
+                event = 'opened'
+        else:
+            inc['peak'] = max(inc['peak'], score)
+            inc['reasons'] += [r for r in reasons if r not in inc['reasons']]
+            if level == 'HIGH' and inc['level'] != 'HIGH':
+                inc['level'] = 'HIGH'
+                event = 'escalated'
+            if score < self.close_thresh:
+                inc['quiet_since'] = inc['quiet_since'] or now
+                if now - inc['quiet_since'] >= self.close_hold:
+                    self.incident = None
+                    event = 'closed'
+            else:
+                inc['quiet_since'] = None
+
+        if inc is not None:
+            return SimpleNamespace(raise_alert=event in ('opened', 'escalated'), level=inc['level'],
+                                   reasons=list(inc['reasons']), score=score, event=event,
+                                   incident=inc['id'], active=self.incident is not None)
+        return SimpleNamespace(raise_alert=False, level='NORMAL', reasons=[], score=score, event=event,
+                               incident=None, active=False)
@@ -1,80 +1,218 @@
-from ultralytics import YOLO
 import numpy as np
 import cv2
+import time
+import threading
+from queue import Queue, Empty
+from concurrent.futures import Future
+from backends import make_backend
+from metrics import registry, SIZE_BUCKETS
+
+WEAPON_CLS = -1  # class id used for weapons inside Detections arrays
+
+
+def box_iou(a, b):
+    """IoU matrix between a (N,4) and b (M,4) xyxy boxes -> (N,M)."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+class Detections:
+    """
+    Struct-of-arrays alternative to the list of {'box','score','cls'} dicts.
+    boxes: (N,4) int32 xyxy, scores: (N,) float32, cls: (N,) int32 (0 = person, WEAPON_CLS = weapon)
+    track_ids: optional (N,) int64, filled in by tracker.Tracker
+    len() and truth-testing behave like the list, and iterating yields the usual dicts
+    for code that still wants them.
+    """
+    def __init__(self, boxes=None, scores=None, cls=None, track_ids=None):
+        self.boxes = np.zeros((0, 4), np.int32) if boxes is None else np.asarray(boxes, np.int32).reshape(-1, 4)
+        self.scores = np.zeros(0, np.float32) if scores is None else np.asarray(scores, np.float32)
+        self.cls = np.zeros(0, np.int32) if cls is None else np.asarray(cls, np.int32)
+        self.track_ids = None if track_ids is None else np.asarray(track_ids, np.int64)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __getitem__(self, idx):
+        ids = None if self.track_ids is None else self.track_ids[idx]
+        return Detections(self.boxes[idx], self.scores[idx], self.cls[idx], ids)
+
+    def __iter__(self):
+        return iter(self.to_dicts())
+
+    @classmethod
+    def concat(cls, parts):
+        return cls(np.concatenate([p.boxes for p in parts]),
+                   np.concatenate([p.scores for p in parts]),
+                   np.concatenate([p.cls for p in parts]))
+
+    def to_dicts(self):
+        objs = [{'box': tuple(b), 'score': s, 'cls': 'weapon' if c == WEAPON_CLS else c}
+                for b, s, c in zip(self.boxes.tolist(), self.scores.tolist(), self.cls.tolist())]
+        if self.track_ids is not None:
+            for o, tid in zip(objs, self.track_ids.tolist()):
+                o['track_id'] = tid
+        return objs
+
 
 class PersonWeaponDetector:
-    def __init__(self, person_model_path="yolov8n.pt", weapon_model_path="best.pt", device='cpu'):
-        # If you have separate weapon model, you can load another YOLO model
-        self.person_model = YOLO(person_model_path)
+    def __init__(self, person_model_path="yolov8n.pt", weapon_model_path="best.pt", device='cpu',
+                 backend='ultralytics', backend_cfg=None, two_stage=False, weapon_imgsz=416, crop_pad=0.15):
+        # backend: 'ultralytics' (PyTorch) or 'onnx' (exported once, served by ONNX Runtime)
+        # backend_cfg for onnx: threads, int8, providers, cache_dir (see backends.OnnxBackend)
+        backend_cfg = backend_cfg or {}
+        self.person_model = make_backend(person_model_path, backend=backend, device=device, **backend_cfg)
         self.weapon_model = None
         if weapon_model_path:
-            self.weapon_model = YOLO(weapon_model_path)
-
-    def predict(self, frame, imgsz=320, conf=0.35):
-        objs = []
-        # Run person model and only keep class 0 (person)
-        results_person = self.person_model(frame, imgsz=imgsz, conf=conf)[0]
-        for b in results_person.boxes:
-            cls = int(b.cls[0])
-            if cls == 0:  # Only person class
-                x1, y1, x2, y2 = map(int, b.xyxy[0].tolist())
-                conf_score = float(b.conf[0])
-                objs.append({'box': (x1, y1, x2, y2), 'score': conf_score, 'cls': cls})
-
-        # Run weapon model if available
-        if self.weapon_model:
-            results_weapon = self.weapon_model(frame, imgsz=imgsz, conf=conf)[0]
-            for b in results_weapon.boxes:
-                x1, y1, x2, y2 = map(int, b.xyxy[0].tolist())
-                conf_score = float(b.conf[0])
-                # Only accept weapon detections above threshold and not overlapping with person boxes
-                weapon_conf_thresh = 0.5
-                if conf_score < weapon_conf_thresh:
+            self.weapon_model = make_backend(weapon_model_path, backend=backend, device=device, **backend_cfg)
+        self._executor = None
+        # Only accept weapon detections above threshold and not overlapping with person boxes
+        self.weapon_conf_thresh = 0.5
+        self.weapon_person_iou = 0.3
+        # two_stage: the person model sees the downscaled full frame, the weapon model only
+        # sees full-resolution crops around each person (padded by crop_pad), at weapon_imgsz
+        self.two_stage = two_stage
+        self.weapon_imgsz = weapon_imgsz
+        self.crop_pad = crop_pad
+
+    def predict(self, frame, imgsz=320, conf=0.35, as_arrays=False):
+        return self.predict_batch([frame], imgsz=imgsz, conf=conf, as_arrays=as_arrays)[0]
+
+    def predict_batch(self, frames, imgsz=320, conf=0.35, parallel=False, as_arrays=False):
+        """
+        frames: list of BGR images (any mix of cameras / time steps)
+        returns: one list of {'box','score','cls'} dicts per frame, same as predict(),
+        or one Detections per frame when as_arrays=True
+        Each model is called once for the whole batch. With parallel=True the person
+        and weapon models run at the same time instead of one after the other.
+        """
+        if not frames:
+            return []
+        if self.two_stage and self.weapon_model:
+            results_person = self.person_model.run(frames, imgsz=imgsz, conf=conf)
+            persons = [self._person_dets(r) for r in results_person]
+            results_weapon = self._run_weapon_on_crops(frames, persons, conf)
+            batch = []
+            for p, res_w in zip(persons, results_weapon):
+                dets = Detections.concat([p, self._weapon_dets(res_w, p)])
+                batch.append(dets if as_arrays else dets.to_dicts())
+            return batch
+        if parallel and self.weapon_model:
+            person_future = self._pool().submit(self.person_model.run, frames, imgsz=imgsz, conf=conf)
+            results_weapon = self.weapon_model.run(frames, imgsz=imgsz, conf=conf)
+            results_person = person_future.result()
+        else:
+            results_person = self.person_model.run(frames, imgsz=imgsz, conf=conf)
+            results_weapon = self.weapon_model.run(frames, imgsz=imgsz, conf=conf) if self.weapon_model else [None] * len(frames)
+        batch = []
+        for res_p, res_w in zip(results_person, results_weapon):
+            persons = self._person_dets(res_p)
+            dets = persons
+            if res_w is not None:
+                dets = Detections.concat([persons, self._weapon_dets(res_w, persons)])
+            batch.append(dets if as_arrays else dets.to_dicts())
+        return batch
+
+    def _pool(self):
+        # lazily created: only needed when person/weapon models run in parallel
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="person-model")
+        return self._executor
+
+    def _run_weapon_on_crops(self, frames, persons, conf):
+        """Weapon model on padded person crops from every frame, in a single batched call."""
+        crops, owners, offsets = [], [], []
+        for fi, (frame, p) in enumerate(zip(frames, persons)):
+            h, w = frame.shape[:2]
+            for x1, y1, x2, y2 in p.boxes.tolist():
+                px, py = int((x2 - x1) * self.crop_pad), int((y2 - y1) * self.crop_pad)
+                cx1, cy1, cx2, cy2 = max(0, x1 - px), max(0, y1 - py), min(w, x2 + px), min(h, y2 + py)
+                if cx2 - cx1 < 8 or cy2 - cy1 < 8:
                     continue
-                weapon_box = (x1, y1, x2, y2)
-                # Check overlap with person boxes
-                overlap = False
-                for p in objs:
-                    if p['cls'] == 0:
-                        px1, py1, px2, py2 = p['box']
-                        # Calculate intersection over union (IoU)
-                        ix1 = max(x1, px1)
-                        iy1 = max(y1, py1)
-                        ix2 = min(x2, px2)
-                        iy2 = min(y2, py2)
-                        iw = max(0, ix2 - ix1)
-                        ih = max(0, iy2 - iy1)
-                        inter = iw * ih
-                        area_w = (x2 - x1) * (y2 - y1)
-                        area_p = (px2 - px1) * (py2 - py1)
-                        union = area_w + area_p - inter
-                        iou = inter / union if union > 0 else 0
-                        if iou > 0.3:
-                            overlap = True
-                            break
-                if not overlap:
-                    objs.append({'box': weapon_box, 'score': conf_score, 'cls': 'weapon'})
-        return objs
+                crops.append(frame[cy1:cy2, cx1:cx2])
+                owners.append(fi)
+                offsets.append((cx1, cy1))
+        per_frame = [[] for _ in frames]
+        if crops:
+            for owner, (ox, oy), (boxes, scores, classes) in zip(
+                    owners, offsets, self.weapon_model.run(crops, imgsz=self.weapon_imgsz, conf=conf)):
+                per_frame[owner].append((boxes + np.array([ox, oy, ox, oy], dtype=boxes.dtype), scores, classes))
+        results = []
+        for parts in per_frame:
+            if not parts:
+                results.append((np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int)))
+                continue
+            boxes = np.concatenate([b for b, _, _ in parts])
+            scores = np.concatenate([s for _, s, _ in parts])
+            classes = np.concatenate([c for _, _, c in parts])
+            if len(parts) > 1 and len(boxes):
+                # neighbouring crops overlap, so the same weapon can be found twice
+                xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+                idx = np.asarray(cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), conf, 0.5), dtype=int).reshape(-1)
+                boxes, scores, classes = boxes[idx], scores[idx], classes[idx]
+            results.append((boxes, scores, classes))
+        return results
+
+    def _person_dets(self, results_person):
+        # only keep class 0 (person) from the COCO model
+        boxes, scores, classes = results_person
+        keep = classes == 0
+        return Detections(boxes[keep].astype(np.int32), scores[keep], np.zeros(int(keep.sum()), np.int32))
+
+    def _weapon_dets(self, results_weapon, persons):
+        boxes, scores, _ = results_weapon
+        boxes = boxes.astype(np.int32)
+        keep = scores >= self.weapon_conf_thresh
+        if len(persons):
+            keep &= ~(box_iou(boxes, persons.boxes) > self.weapon_person_iou).any(axis=1)
+        return Detections(boxes[keep], scores[keep], np.full(int(keep.sum()), WEAPON_CLS, np.int32))
+
+    @staticmethod
+    def shift(objs, dx, dy):
+        """Move detections found on a crop back into full-frame coordinates."""
+        if not dx and not dy:
+            return objs
+        if isinstance(objs, Detections):
+            shifted = objs[:]
+            shifted.boxes = objs.boxes + np.array([dx, dy, dx, dy], dtype=np.int32)
+            return shifted
+        return [dict(o, box=(o['box'][0] + dx, o['box'][1] + dy, o['box'][2] + dx, o['box'][3] + dy)) for o in objs]
 
     def filter_by_class(self, objs, class_name='person'):
+        if isinstance(objs, Detections):
+            if class_name == 'person':
+                return objs[objs.cls == 0]
+            if class_name == 'weapon':
+                return objs[objs.cls == WEAPON_CLS]
+            return Detections()
         if class_name == 'person':
             return [o for o in objs if o['cls'] == 0]
         if class_name == 'weapon':
             return [o for o in objs if o['cls'] == 'weapon']
         return []
 
-    def annotate_frame(self, frame, persons, weapons, tamper_res, action_res):
-        out = frame.copy()
+    @staticmethod
+    def annotate_frame(frame, persons, weapons, tamper_res, action_res, copy=True):
+        # copy=False draws straight into frame (caller owns the buffer)
+        out = frame.copy() if copy else frame
         # persons
-        for p in persons:
-            x1,y1,x2,y2 = p['box']
+        for (x1,y1,x2,y2), score in PersonWeaponDetector._boxes_scores(persons):
             cv2.rectangle(out, (x1,y1),(x2,y2),(0,255,0),2)
-            cv2.putText(out, f"Person {p.get('score',0):.2f}", (x1,y1-8), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,255,0),1)
+            cv2.putText(out, f"Person {score:.2f}", (x1,y1-8), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,255,0),1)
         # weapons
-        for w in weapons:
-            x1,y1,x2,y2 = w['box']
+        for (x1,y1,x2,y2), score in PersonWeaponDetector._boxes_scores(weapons):
             cv2.rectangle(out, (x1,y1),(x2,y2),(0,0,255),2)
-            cv2.putText(out, f"Weapon {w.get('score',0):.2f}", (x1,y1-8), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,255),1)
+            cv2.putText(out, f"Weapon {score:.2f}", (x1,y1-8), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,255),1)
         # tamper overlay
         if tamper_res.get('covered'):
             cv2.putText(out, "TAMPER DETECTED: "+tamper_res.get('reason',''), (10,30), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,0,255),2)
@@ -82,3 +220,136 @@ class PersonWeaponDetector:
         if action_res.get('loitering'):
             cv2.putText(out, "LOITERING", (10,60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,165,255),2)
         return out
+
+    @staticmethod
+    def _boxes_scores(dets):
+        if isinstance(dets, Detections):
+            return zip(dets.boxes.tolist(), dets.scores.tolist())
+        return ((d['box'], d.get('score', 0)) for d in dets)
+
+
+class BatchInferenceEngine:
+    """
+    Collects frames submitted from any number of camera threads and runs them
+    through one PersonWeaponDetector in batches. Camera threads register() while they
+    run; each has at most one frame in flight, so a batch is flushed as soon as every
+    registered submitter has a frame queued (straight away with one camera or none
+    registered), at max_batch frames, or once the oldest frame has waited max_wait
+    seconds for cameras that are running behind or skipping frames.
+    Each future also gets a `compute` attribute: its frame's share of the batch's
+    detector time, excluding the time spent queued or waiting for the batch to fill.
+    After stop(), queued and newly submitted frames fail with RuntimeError instead of
+    leaving their callers blocked in infer().
+    """
+    def __init__(self, detector, max_batch=8, max_wait=0.05, imgsz=320, conf=0.35, parallel=False, as_arrays=False):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.imgsz = imgsz
+        self.conf = conf
+        self.parallel = parallel
+        self.as_arrays = as_arrays
+        self.requests = Queue()
+        self.last_batch_size = 0
+        self.submitters = 0             # registered camera threads
+        self._stopped = False
+        self._lock = threading.Lock()   # orders submit() against stop() and the final drain
+        self._thread = threading.Thread(target=self._run, name="batch-inference", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        """Queue a frame for detection; returns a Future resolving to the frame's objs list."""
+        fut = Future()
+        with self._lock:
+            if self._stopped:
+                fut.set_exception(RuntimeError("inference engine stopped"))
+            else:
+                self.requests.put((frame, fut))
+        return fut
+
+    def register(self):
+        with self._lock:
+            self.submitters += 1
+
+    def unregister(self):
+        with self._lock:
+            self.submitters = max(0, self.submitters - 1)
+        # a batch waiting for this submitter's frame can go now
+        self.requests.put(('wake', None))
+
+    def infer(self, frame, timeout=None):
+        return self.submit(frame).result(timeout=timeout)
+
+    def infer_timed(self, frame, timeout=None):
+        """(objs, compute seconds) for one frame; what the scheduler's cpu_budget should be charged."""
+        fut = self.submit(frame)
+        objs = fut.result(timeout=timeout)
+        return objs, fut.compute
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self.requests.put(None)
+
+    def _fail_pending(self):
+        # after stop(): nothing is queued any more, so whatever is left never runs
+        with self._lock:
+            while True:
+                try:
+                    item = self.requests.get_nowait()
+                except Empty:
+                    break
+                if item is not None and item[1] is not None:
+                    item[1].set_exception(RuntimeError("inference engine stopped"))
+
+    def _collect(self):
+        first = self.requests.get()
+        while first is not None and first[1] is None:
+            first = self.requests.get()     # wake-ups with nothing waiting
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                # whatever is already queued rides along, registered or not
+                item = self.requests.get_nowait()
+            except Empty:
+                if len(batch) >= self.submitters:
+                    break   # nobody else is expected to submit
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except Empty:
+                    break
+            if item is None:
+                self._stopped = True
+                break
+            if item[1] is not None:
+                batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped:
+            batch = self._collect()
+            if not batch:
+                continue
+            frames = [f for f, _ in batch]
+            self.last_batch_size = len(frames)
+            registry.observe('inference_batch_size', len(frames), buckets=SIZE_BUCKETS)
+            t0 = time.perf_counter()
+            try:
+                with registry.timer('inference_batch_seconds'):
+                    results = self.detector.predict_batch(frames, imgsz=self.imgsz, conf=self.conf,
+                                                           parallel=self.parallel, as_arrays=self.as_arrays)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            compute = (time.perf_counter() - t0) / len(frames)
+            for (_, fut), objs in zip(batch, results):
+                fut.compute = compute
+                fut.set_result(objs)
+        self._fail_pending()
@@ -0,0 +1,217 @@
+"""
+Edge side of the edge/central split: detection runs next to the camera and only
+compact per-frame detection records (edge_protocol.py) go to the aggregator.
+
+    python edge.py --central 10.0.0.5:7000 --edge-id branch12 --camera atm1 --source rtsp://...
+    python edge.py --central 127.0.0.1:7000 --edge-id sim1 --camera atm1 --simulate   # no camera or models
+
+--simulate publishes synthetic records (people walking through, a weapon now and
+then, the odd tamper), so several edges can be run against one aggregator on a
+single machine.
+"""
+import argparse
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from edge_protocol import encode_hello, encode_detections
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+
+class EdgePublisher:
+    """
+    Sends one camera's detection records to the aggregator over TCP.
+    publish() encodes and queues without blocking; a sender thread connects
+    (re-sending HELLO on every reconnect) and drains the queue. While the link is
+    down the newest queue_size records are kept and older ones dropped, so a slow or
+    absent aggregator never stalls detection.
+    """
+    def __init__(self, address, edge_id, camera_id, frame_size=(0, 0), queue_size=256, reconnect=2.0):
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.edge_id = edge_id
+        self.camera_id = camera_id
+        self.frame_size = frame_size
+        self.reconnect = reconnect
+        self.queue = deque(maxlen=queue_size)
+        self.cond = threading.Condition()
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.connected = False
+        self.stop_flag = False
+        self.thread = threading.Thread(target=self._sender, name=f"edge-{camera_id}", daemon=True)
+        self.thread.start()
+
+    def publish(self, seq, ts, persons, weapons, tamper_res, action_res, score=0.0, inferred=True):
+        msg = encode_detections(seq, ts, persons, weapons, tamper_res, action_res, score=score, inferred=inferred)
+        with self.cond:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+                registry.inc('edge_records_dropped_total', camera=self.camera_id)
+            self.queue.append(msg)
+            self.cond.notify()
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=5.0)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(encode_hello(self.edge_id, self.camera_id, *self.frame_size))
+        return sock
+
+    def _sender(self):
+        sock = None
+        while not self.stop_flag:
+            if sock is None:
+                try:
+                    sock = self._connect()
+                    self.connected = True
+                    log.info("connected to aggregator %s:%d camera=%s", *self.address, self.camera_id)
+                except OSError as e:
+                    log.warning("aggregator %s:%d unreachable: %s", *self.address, e)
+                    time.sleep(self.reconnect)
+                    continue
+            with self.cond:
+                while not self.queue and not self.stop_flag:
+                    self.cond.wait(1.0)
+                batch = list(self.queue)
+                self.queue.clear()
+            if not batch:
+                continue
+            data = b''.join(batch)
+            try:
+                sock.sendall(data)
+            except OSError as e:
+                log.warning("aggregator connection lost: %s", e)
+                sock.close()
+                sock, self.connected = None, False
+                with self.cond:
+                    # put the unsent records back in front of anything queued meanwhile, newest kept
+                    pending = batch + list(self.queue)
+                    self.dropped += max(0, len(pending) - self.queue.maxlen)
+                    self.queue.clear()
+                    self.queue.extend(pending[-self.queue.maxlen:])
+                continue
+            self.sent += len(batch)
+            self.bytes_sent += len(data)
+        if sock is not None:
+            sock.close()
+
+    def close(self):
+        self.stop_flag = True
+        with self.cond:
+            self.cond.notify()
+        self.thread.join(timeout=5.0)
+
+    def stats(self):
+        return {'connected': self.connected, 'sent': self.sent, 'dropped': self.dropped,
+                'bytes_sent': self.bytes_sent, 'queued': len(self.queue)}
+
+
+def simulate(publisher, fps=10.0, frames=None, size=(1280, 720), seed=None, weapon_every=30.0, tamper_every=90.0):
+    """
+    Synthetic records: people crossing the frame, a weapon about every weapon_every
+    seconds and a covered camera about every tamper_every seconds.
+    """
+    rng = random.Random(seed)
+    w, h = size
+    people = {}      # {track_id: [x, y, dx]}
+    next_id = 1
+    seq = 0
+    weapon_until = tamper_until = 0.0
+    while frames is None or seq < frames:
+        now = time.time()
+        seq += 1
+        if rng.random() < 0.02 and len(people) < 3:
+            # enters from the left or the right edge and walks across
+            left = rng.random() < 0.5
+            people[next_id] = [0.0 if left else w - 100.0, h * 0.3, rng.uniform(4, 12) * (1 if left else -1)]
+            next_id += 1
+        for tid, p in list(people.items()):
+            p[0] += p[2]
+            if p[0] < -100 or p[0] > w:
+                del people[tid]
+        persons = [{'box': (int(x), int(y), int(x) + 100, int(y) + 260), 'score': 0.9, 'track_id': tid}
+                   for tid, (x, y, _) in people.items()]
+        if persons and not weapon_until and rng.random() < 1 / (weapon_every * fps):
+            weapon_until = now + 3.0
+        weapons = []
+        if weapon_until > now and persons:
+            x1, y1, x2, y2 = persons[0]['box']
+            weapons = [{'box': (x2 - 30, y1 + 80, x2 + 20, y1 + 120), 'score': 0.8, 'cls': 'weapon'}]
+        elif weapon_until and weapon_until <= now:
+            weapon_until = 0.0
+        if not tamper_until and rng.random() < 1 / (tamper_every * fps):
+            tamper_until = now + 4.0
+        covered = tamper_until > now
+        if tamper_until and not covered:
+            tamper_until = 0.0
+        tamper_res = {'covered': True, 'reason': 'black_frame'} if covered else {'covered': False}
+        publisher.publish(seq, now, [] if covered else persons, weapons, tamper_res,
+                          {'actions': [], 'loitering': False}, inferred=True)
+        time.sleep(max(0.0, 1.0 / fps - (time.time() - now)))
+
+
+def run_edge(args):
+    """Real pipeline: main.detector_worker with its output going to the aggregator."""
+    from queue import Queue
+    import main
+    from detectors import PersonWeaponDetector
+    from tamper import TamperDetector
+    from action_detector import ActionDetector
+    from decision import DecisionEngine
+    from capture import FrameGrabber
+    from model_registry import warm_detector
+    grabber = FrameGrabber(args.source, max_age=1.0, max_width=args.max_width).start()
+    detector = warm_detector(PersonWeaponDetector(person_model_path=args.person_model,
+                                                  weapon_model_path=args.weapon_model, device=args.device))
+    publisher = EdgePublisher(args.central, args.edge_id, args.camera)
+    main.detector_worker(grabber, Queue(maxsize=1), detector, TamperDetector(), ActionDetector(), DecisionEngine(),
+                         None, publisher=publisher)
+    publisher.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--central', default='127.0.0.1:7000', help="aggregator host:port")
+    ap.add_argument('--edge-id', default=socket.gethostname())
+    ap.add_argument('--camera', default='default')
+    ap.add_argument('--source', help="video file or RTSP URL")
+    ap.add_argument('--simulate', action='store_true', help="publish synthetic records instead")
+    ap.add_argument('--fps', type=float, default=10.0, help="--simulate record rate")
+    ap.add_argument('--frames', type=int, help="--simulate: stop after N records")
+    ap.add_argument('--seed', type=int)
+    ap.add_argument('--weapon-every', type=float, default=30.0, help="--simulate: mean seconds between weapons")
+    ap.add_argument('--tamper-every', type=float, default=90.0, help="--simulate: mean seconds between tampers")
+    ap.add_argument('--max-width', type=int, default=1280)
+    ap.add_argument('--person-model', default='yolov8n.pt')
+    ap.add_argument('--weapon-model', default='best.pt')
+    ap.add_argument('--device', default='cpu')
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    if args.simulate:
+        publisher = EdgePublisher(args.central, args.edge_id, args.camera, frame_size=(1280, 720))
+        try:
+            simulate(publisher, fps=args.fps, frames=args.frames, seed=args.seed,
+                     weapon_every=args.weapon_every, tamper_every=args.tamper_every)
+        except KeyboardInterrupt:
+            pass
+        # let the last records go out
+        deadline = time.time() + 5.0
+        while publisher.queue and publisher.connected and time.time() < deadline:
+            time.sleep(0.05)
+        publisher.close()
+        log.info("simulated edge done %s", publisher.stats())
+    elif args.source:
+        run_edge(args)
+    else:
+        ap.error("--source or --simulate is required")
+
+
+if __name__ == '__main__':
+    main()
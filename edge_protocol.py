@@ -0,0 +1,172 @@
+"""
+Wire format between edge detectors (edge.py, main.py with ATM_CENTRAL set) and the
+central aggregator (aggregator.py). One TCP connection carries one camera.
+
+Every message is framed as
+
+    uint32 length (little endian) | payload[length]
+
+and the payload's first byte is its type. All integers are little endian.
+
+HELLO 'H', sent first on every (re)connect:
+
+    char   'H'
+    uint8  version            PROTOCOL_VERSION
+    uint16 width, height      frame size the boxes refer to (0 if unknown)
+    uint8  n | n bytes utf-8  edge_id
+    uint8  n | n bytes utf-8  camera_id
+
+DETECTIONS 'D', one per processed frame (22 byte header):
+
+    char    'D'
+    uint8   flags             bit 0 inferred (detector ran on this frame; otherwise
+                              persons are tracker extrapolations), bit 1 camera covered,
+                              bit 2 loitering
+    uint32  seq               frame counter on the edge
+    float64 ts                capture time, unix seconds
+    float32 score             the edge's own DecisionEngine score
+    uint8   tamper            index into TAMPER_REASONS, 0 if not covered
+    uint8   n_persons, n_weapons, n_actions
+    n_persons x PERSON        int32 track_id, int16 x1 y1 x2 y2, uint8 score*255   (13 bytes)
+    n_weapons x WEAPON        int16 x1 y1 x2 y2, uint8 score*255                   (9 bytes)
+    n_actions x ACTION        int32 track_id, uint8 index into ACTIONS             (5 bytes)
+
+A frame with two people is about 50 bytes, against tens of kilobytes for a JPEG.
+Codes are append-only: new reasons/actions get new indices, existing ones never move.
+"""
+import struct
+import numpy as np
+
+PROTOCOL_VERSION = 1
+MAX_MESSAGE = 64 * 1024
+
+TAMPER_REASONS = ('', 'black_frame', 'white_frame', 'blurred', 'obscured', 'partial_occlusion', 'camera_moved',
+                  'frozen_frame', 'other')
+ACTIONS = ('other', 'violent_motion', 'possible_faint')
+
+FLAG_INFERRED, FLAG_COVERED, FLAG_LOITERING = 1, 2, 4
+
+_LEN = struct.Struct('<I')
+_HELLO = struct.Struct('<cBHH')
+_HEADER = struct.Struct('<cBIdfBBBB')
+PERSON = np.dtype([('track_id', '<i4'), ('box', '<i2', 4), ('score', 'u1')])
+WEAPON = np.dtype([('box', '<i2', 4), ('score', 'u1')])
+ACTION = np.dtype([('track_id', '<i4'), ('type', 'u1')])
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def _str(s):
+    b = str(s).encode('utf-8')[:255]
+    return bytes([len(b)]) + b
+
+
+def _boxes(objs):
+    """(boxes, scores, track_ids) arrays from detectors.Detections or a list of dicts."""
+    if hasattr(objs, 'boxes'):
+        ids = objs.track_ids if objs.track_ids is not None else np.arange(len(objs))
+        return objs.boxes[:255], objs.scores[:255], ids[:255]
+    objs = list(objs)[:255]
+    boxes = np.array([o['box'] for o in objs], np.int64).reshape(-1, 4)
+    scores = np.array([o.get('score', 1.0) for o in objs], np.float32)
+    ids = np.array([o.get('track_id', i) for i, o in enumerate(objs)], np.int64)
+    return boxes, scores, ids
+
+
+def frame(payload):
+    return _LEN.pack(len(payload)) + payload
+
+
+def encode_hello(edge_id, camera_id, width=0, height=0):
+    return frame(_HELLO.pack(b'H', PROTOCOL_VERSION, width, height) + _str(edge_id) + _str(camera_id))
+
+
+def encode_detections(seq, ts, persons, weapons, tamper_res, action_res, score=0.0, inferred=True):
+    p_boxes, p_scores, p_ids = _boxes(persons)
+    w_boxes, w_scores, _ = _boxes(weapons if weapons is not None else [])
+    actions = action_res.get('actions', [])[:255]
+    tamper = 0
+    if tamper_res.get('covered'):
+        reason = tamper_res.get('reason', 'other')
+        tamper = TAMPER_REASONS.index(reason) if reason in TAMPER_REASONS else TAMPER_REASONS.index('other')
+    flags = ((FLAG_INFERRED if inferred else 0) | (FLAG_COVERED if tamper_res.get('covered') else 0)
+             | (FLAG_LOITERING if action_res.get('loitering') else 0))
+
+    p = np.empty(len(p_scores), PERSON)
+    p['track_id'] = p_ids
+    p['box'] = np.clip(p_boxes, -32768, 32767)
+    p['score'] = np.clip(np.asarray(p_scores) * 255, 0, 255)
+    w = np.empty(len(w_scores), WEAPON)
+    w['box'] = np.clip(w_boxes, -32768, 32767)
+    w['score'] = np.clip(np.asarray(w_scores) * 255, 0, 255)
+    a = np.empty(len(actions), ACTION)
+    a['track_id'] = [x['id'] for x in actions]
+    a['type'] = [ACTIONS.index(x['type']) if x['type'] in ACTIONS else 0 for x in actions]
+    header = _HEADER.pack(b'D', flags, seq & 0xFFFFFFFF, ts, score, tamper, len(p), len(w), len(a))
+    return frame(header + p.tobytes() + w.tobytes() + a.tobytes())
+
+
+def decode(payload):
+    """
+    payload (without the length prefix) -> dict with 'type' 'hello' or 'detections'.
+    Detections come back in the shapes DecisionEngine.evaluate takes: 'persons'
+    and 'weapons' as lists of {'box', 'score', ...}, 'tamper' and 'action' dicts.
+    """
+    kind = payload[:1]
+    if kind == b'H':
+        _, version, width, height = _HELLO.unpack_from(payload)
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f"unsupported protocol version {version}")
+        off = _HELLO.size
+        n = payload[off]
+        edge_id = payload[off + 1:off + 1 + n].decode('utf-8')
+        off += 1 + n
+        n = payload[off]
+        camera_id = payload[off + 1:off + 1 + n].decode('utf-8')
+        return {'type': 'hello', 'edge_id': edge_id, 'camera_id': camera_id, 'size': (width, height)}
+    if kind != b'D':
+        raise ProtocolError(f"unknown message type {kind!r}")
+    _, flags, seq, ts, score, tamper, n_p, n_w, n_a = _HEADER.unpack_from(payload)
+    off = _HEADER.size
+    if len(payload) != off + n_p * PERSON.itemsize + n_w * WEAPON.itemsize + n_a * ACTION.itemsize:
+        raise ProtocolError("detections message has the wrong length")
+    p = np.frombuffer(payload, PERSON, n_p, off)
+    off += p.nbytes
+    w = np.frombuffer(payload, WEAPON, n_w, off)
+    off += w.nbytes
+    a = np.frombuffer(payload, ACTION, n_a, off)
+    covered = bool(flags & FLAG_COVERED)
+    tamper_res = {'covered': covered}
+    if covered:
+        tamper_res['reason'] = TAMPER_REASONS[tamper] if tamper < len(TAMPER_REASONS) else 'other'
+    return {
+        'type': 'detections',
+        'seq': seq,
+        'ts': ts,
+        'score': score,
+        'inferred': bool(flags & FLAG_INFERRED),
+        'persons': [{'box': tuple(b), 'score': s / 255, 'track_id': t}
+                    for t, b, s in zip(p['track_id'].tolist(), p['box'].tolist(), p['score'].tolist())],
+        'weapons': [{'box': tuple(b), 'score': s / 255, 'cls': 'weapon'}
+                    for b, s in zip(w['box'].tolist(), w['score'].tolist())],
+        'tamper': tamper_res,
+        'action': {'actions': [{'id': t, 'type': ACTIONS[k] if k < len(ACTIONS) else 'other'}
+                               for t, k in zip(a['track_id'].tolist(), a['type'].tolist())],
+                   'loitering': bool(flags & FLAG_LOITERING)},
+    }
+
+
+def read_message(sock_file):
+    """Next payload from a socket's makefile('rb'); None at end of stream."""
+    head = sock_file.read(_LEN.size)
+    if len(head) < _LEN.size:
+        return None
+    (n,) = _LEN.unpack(head)
+    if n > MAX_MESSAGE:
+        raise ProtocolError(f"message of {n} bytes exceeds {MAX_MESSAGE}")
+    payload = sock_file.read(n)
+    if len(payload) < n:
+        return None
+    return payload
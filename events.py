@@ -0,0 +1,89 @@
+import json
+import time
+import threading
+from collections import deque
+
+
+class EventBus:
+    """
+    In-memory event log for dashboard push (Server-Sent Events).
+    publish() appends {'id', 'type', 'ts', 'data'} with an increasing id; stream()
+    yields every event after a cursor (the SSE Last-Event-ID), then blocks until
+    new ones arrive, so an idle dashboard costs one parked connection and nothing else.
+    Only the last `history` events are kept: a client whose cursor fell out of the log
+    (or predates a server restart) gets a 'reset' event and should refetch /get_alerts.
+    """
+    def __init__(self, history=1000, heartbeat=15.0):
+        self.events = deque(maxlen=history)
+        self.heartbeat = heartbeat
+        self.last_id = 0
+        self.cond = threading.Condition()
+
+    def publish(self, type, data):
+        with self.cond:
+            self.last_id += 1
+            self.events.append({'id': self.last_id, 'type': type, 'ts': time.time(), 'data': data})
+            self.cond.notify_all()
+        return self.last_id
+
+    def since(self, cursor):
+        """Events after cursor; None if the cursor can't be resumed from."""
+        with self.cond:
+            first = self.events[0]['id'] if self.events else self.last_id + 1
+            if cursor > self.last_id or cursor < first - 1:
+                return None
+            return [e for e in self.events if e['id'] > cursor]
+
+    @staticmethod
+    def format(event):
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    def stream(self, cursor=None, accept=None):
+        """
+        SSE body generator. cursor=None starts at the current end of the log.
+        accept(event) -> bool filters events (e.g. by camera).
+        """
+        yield "retry: 2000\n\n"
+        if cursor is None:
+            cursor = self.last_id
+        while True:
+            with self.cond:
+                if self.last_id <= cursor:
+                    self.cond.wait(self.heartbeat)
+            events = self.since(cursor)
+            if events is None:
+                cursor = self.last_id
+                yield self.format({'id': cursor, 'type': 'reset', 'data': {'last_id': cursor}})
+                continue
+            if not events:
+                # comment line: keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                if accept is None or accept(event):
+                    yield self.format(event)
+            cursor = events[-1]['id']
+
+
+class SnapshotCache:
+    """
+    Latest alert snapshot per camera, held as JPEG bytes with an ETag and
+    Last-Modified time so /latest_alert_snapshot can answer from memory (or with
+    304 Not Modified) instead of rereading the file on every poll.
+    """
+    def __init__(self):
+        self.entries = {}   # {camera_id: (data, etag, timestamp)}
+        self.lock = threading.Lock()
+
+    def put(self, camera_id, data, alert_id, timestamp=None):
+        entry = (data, f"{alert_id}-{len(data)}", timestamp or time.time())
+        with self.lock:
+            self.entries[camera_id] = entry
+        return entry
+
+    def get(self, camera_id=None):
+        """camera_id=None: newest entry across cameras."""
+        with self.lock:
+            if camera_id is not None:
+                return self.entries.get(camera_id)
+            return max(self.entries.values(), key=lambda e: e[2], default=None)
@@ -0,0 +1,311 @@
+"""
+Offline forensic scan of a recorded video.
+
+Instead of replaying the file through the live pipeline at wall-clock speed, the
+video is cut into segments that worker processes decode in parallel (each seeks
+to its segment, grabs every frame but only decodes/keeps every --stride-th one)
+and run through the detector in batches. The parent then runs tracking and the
+DecisionEngine over the samples on video time and writes a timeline of
+detections and incidents with seekable timestamps.
+
+    python forensic.py uploads/robbery.mp4 --stride 5 --json timeline.json --db forensic.db
+    python forensic.py uploads/robbery.mp4 --workers 8 --batch 16 --backend onnx
+
+Pose/action cues (loitering, violent motion, faint) are not part of the scan: they
+need per-track crops of consecutive frames; detections and tamper cues are.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import cv2
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, Float, String, Text, Index
+
+log = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+scans_table = Table(
+    'forensic_scans', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('source', Text, nullable=False),
+    Column('created', Float, nullable=False),
+    Column('fps', Float),
+    Column('frames', Integer),
+    Column('duration', Float),
+    Column('stride', Integer),
+    Column('elapsed', Float),
+)
+detections_table = Table(
+    'forensic_detections', metadata,
+    Column('scan_id', Integer, nullable=False),
+    Column('t', Float, nullable=False),          # seconds into the video
+    Column('frame', Integer, nullable=False),
+    Column('kind', String(16), nullable=False),  # 'person' / 'weapon' / 'tamper'
+    Column('track_id', Integer),
+    Column('x1', Integer), Column('y1', Integer), Column('x2', Integer), Column('y2', Integer),
+    Column('score', Float),
+    Column('reason', String(32)),                # tamper reason
+    Index('ix_forensic_detections_scan_t', 'scan_id', 't'),
+)
+incidents_table = Table(
+    'forensic_incidents', metadata,
+    Column('scan_id', Integer, nullable=False),
+    Column('incident', Integer, nullable=False),
+    Column('start', Float, nullable=False),
+    Column('end', Float),
+    Column('start_frame', Integer),
+    Column('level', String(16)),
+    Column('reasons', Text),                     # JSON list
+    Column('peak', Float),
+)
+
+_detector = None   # one per worker process, loaded by _init_worker
+
+
+def _init_worker(detector_cfg, threads):
+    global _detector
+    from detectors import PersonWeaponDetector
+    # the pool already uses every core; keep each worker's libraries from oversubscribing
+    cv2.setNumThreads(1)
+    if detector_cfg.get('backend', 'ultralytics') == 'ultralytics':
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _detector = PersonWeaponDetector(**detector_cfg)
+
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"cannot open video {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return fps, frames
+
+
+def plan_segments(frames, fps, stride, segment_seconds=60.0):
+    """[(start, end)] frame ranges, each starting on a sampled frame."""
+    step = max(stride, int(round(segment_seconds * fps / stride)) * stride)
+    return [(s, min(s + step, frames)) for s in range(0, frames, step)]
+
+
+def scan_segment(path, start, end, stride=5, batch=8, max_width=1280, imgsz=320, conf=0.35, fps=25.0):
+    """
+    Runs in a worker: detections and tamper result for every stride-th frame in [start, end).
+    returns: list of (frame index, person boxes, person scores, weapon boxes, weapon scores, tamper_res)
+    """
+    from tamper import TamperDetector
+    # the tamper detector's freeze timing is in frames; it sees one every `stride`
+    tamper = TamperDetector(fps=max(1, round(fps / stride)))
+    cap = cv2.VideoCapture(path)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    samples, pending = [], []
+
+    def flush():
+        results = _detector.predict_batch([f for _, f, _ in pending], imgsz=imgsz, conf=conf, as_arrays=True)
+        for (idx, _, tamper_res), objs in zip(pending, results):
+            persons = _detector.filter_by_class(objs, class_name='person')
+            weapons = _detector.filter_by_class(objs, class_name='weapon')
+            samples.append((idx, persons.boxes, persons.scores, weapons.boxes, weapons.scores, tamper_res))
+        pending.clear()
+
+    for idx in range(start, end):
+        if (idx - start) % stride:
+            # skipped frames are only grabbed, never converted to BGR
+            if not cap.grab():
+                break
+            continue
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if max_width and frame.shape[1] > max_width:
+            frame = cv2.resize(frame, (max_width, int(frame.shape[0] * max_width / frame.shape[1])),
+                               interpolation=cv2.INTER_AREA)
+        pending.append((idx, frame, tamper.check(frame)))
+        if len(pending) >= batch:
+            flush()
+    if pending:
+        flush()
+    cap.release()
+    return samples
+
+
+def timestamp(t):
+    """Seconds -> 'HH:MM:SS.mmm', for seeking a player to the event."""
+    ms = int(round(t * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def build_timeline(samples, fps, stride):
+    """Tracking and incident detection over the merged samples, in frame order and on video time."""
+    from detectors import Detections
+    from tracker import Tracker
+    from decision import DecisionEngine
+    tracker = Tracker(max_age=max(2, 15 // stride))   # max_age counts samples here, not frames
+    engine = DecisionEngine()
+    detections, incidents = [], []
+    current = None
+    no_action = {'actions': [], 'loitering': False}
+    for idx, p_boxes, p_scores, w_boxes, w_scores, tamper_res in samples:
+        t = idx / fps
+        persons = tracker.update(Detections(p_boxes, p_scores, np.zeros(len(p_scores), np.int32)))
+        weapons = [{'box': tuple(b), 'score': s} for b, s in zip(w_boxes.tolist(), w_scores.tolist())]
+        decision = engine.evaluate(persons, weapons, tamper_res, no_action, now=t)
+        if len(persons) or weapons or tamper_res.get('covered'):
+            detections.append({
+                't': round(t, 3), 'time': timestamp(t), 'frame': idx,
+                'persons': [{'track_id': o['track_id'], 'box': list(o['box']), 'score': round(o['score'], 3)}
+                            for o in persons],
+                'weapons': [{'box': list(o['box']), 'score': round(o['score'], 3)} for o in weapons],
+                'tamper': tamper_res.get('reason') if tamper_res.get('covered') else None,
+            })
+        if decision.event == 'opened':
+            current = {'incident': decision.incident, 'start': round(t, 3), 'time': timestamp(t), 'start_frame': idx,
+                       'end': None, 'level': decision.level, 'reasons': decision.reasons, 'peak': decision.score}
+            incidents.append(current)
+        if current is not None:
+            if decision.event == 'closed':
+                current = None
+                continue
+            current['level'], current['reasons'] = decision.level, decision.reasons
+            current['peak'] = round(max(current['peak'], decision.score), 3)
+            # ends at the last sample that still looked active, not after close_hold
+            if decision.score >= engine.close_thresh or current['end'] is None:
+                current['end'] = round(t, 3)
+    return detections, incidents
+
+
+def scan_video(path, stride=5, batch=8, workers=None, segment_seconds=60.0, max_width=1280, imgsz=320, conf=0.35,
+               detector_cfg=None, progress=None):
+    """
+    Scans the whole file; returns the timeline dict (see write_json).
+    workers: processes (default: all cores); 1 scans in this process.
+    progress(done_frames, total_frames) is called as segments finish.
+    """
+    t0 = time.monotonic()
+    detector_cfg = dict(detector_cfg or {})
+    fps, frames = video_info(path)
+    segments = plan_segments(frames, fps, stride, segment_seconds)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(segments)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    kwargs = dict(stride=stride, batch=batch, max_width=max_width, imgsz=imgsz, conf=conf, fps=fps)
+    log.info("forensic scan source=%s frames=%d fps=%.1f segments=%d workers=%d stride=%d",
+             path, frames, fps, len(segments), workers, stride)
+    results, done = {}, 0
+    if workers == 1:
+        _init_worker(detector_cfg, threads)
+        for seg in segments:
+            results[seg] = scan_segment(path, *seg, **kwargs)
+            done += seg[1] - seg[0]
+            if progress:
+                progress(done, frames)
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(detector_cfg, threads)) as pool:
+            futures = {pool.submit(scan_segment, path, *seg, **kwargs): seg for seg in segments}
+            for fut in as_completed(futures):
+                seg = futures[fut]
+                results[seg] = fut.result()
+                done += seg[1] - seg[0]
+                if progress:
+                    progress(done, frames)
+    samples = [s for seg in segments for s in results[seg]]
+    detections, incidents = build_timeline(samples, fps, stride)
+    elapsed = time.monotonic() - t0
+    log.info("forensic scan done source=%s seconds=%.1f speedup=%.1fx incidents=%d",
+             path, elapsed, frames / fps / elapsed if elapsed else 0, len(incidents))
+    return {
+        'source': path,
+        'fps': fps,
+        'frames': frames,
+        'duration': round(frames / fps, 3),
+        'stride': stride,
+        'samples': len(samples),
+        'elapsed': round(elapsed, 2),
+        'detections': detections,
+        'incidents': incidents,
+    }
+
+
+def write_json(timeline, path):
+    with open(path, 'w') as f:
+        json.dump(timeline, f)
+
+
+def write_sqlite(timeline, url):
+    """Appends the scan to a SQLite timeline index; returns its scan id."""
+    engine = create_engine(url)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        scan_id = conn.execute(scans_table.insert().values(
+            source=timeline['source'], created=time.time(), fps=timeline['fps'], frames=timeline['frames'],
+            duration=timeline['duration'], stride=timeline['stride'], elapsed=timeline['elapsed'])).inserted_primary_key[0]
+        rows = []
+        for d in timeline['detections']:
+            base = {'scan_id': scan_id, 't': d['t'], 'frame': d['frame'], 'track_id': None, 'reason': None}
+            for kind in ('persons', 'weapons'):
+                for o in d[kind]:
+                    x1, y1, x2, y2 = o['box']
+                    rows.append(dict(base, kind=kind[:-1], track_id=o.get('track_id'), x1=x1, y1=y1, x2=x2, y2=y2,
+                                     score=o['score']))
+            if d['tamper']:
+                rows.append(dict(base, kind='tamper', reason=d['tamper'], x1=None, y1=None, x2=None, y2=None,
+                                 score=None))
+        if rows:
+            conn.execute(detections_table.insert(), rows)
+        if timeline['incidents']:
+            conn.execute(incidents_table.insert(), [
+                {'scan_id': scan_id, 'incident': i['incident'], 'start': i['start'], 'end': i['end'],
+                 'start_frame': i['start_frame'], 'level': i['level'], 'reasons': json.dumps(i['reasons']),
+                 'peak': i['peak']} for i in timeline['incidents']])
+    engine.dispose()
+    return scan_id
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('source', help="video file")
+    ap.add_argument('--stride', type=int, default=5, help="analyse every Nth frame")
+    ap.add_argument('--batch', type=int, default=8, help="frames per detector call")
+    ap.add_argument('--workers', type=int, help="processes (default: all cores)")
+    ap.add_argument('--segment-seconds', type=float, default=60.0, help="video seconds per work unit")
+    ap.add_argument('--max-width', type=int, default=1280)
+    ap.add_argument('--imgsz', type=int, default=320)
+    ap.add_argument('--conf', type=float, default=0.35)
+    ap.add_argument('--person-model', default='yolov8n.pt')
+    ap.add_argument('--weapon-model', default='best.pt')
+    ap.add_argument('--backend', default='ultralytics')
+    ap.add_argument('--device', default='cpu')
+    ap.add_argument('--json', help="write the timeline to this JSON file")
+    ap.add_argument('--db', help="append the timeline to this SQLite file")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    detector_cfg = {'person_model_path': args.person_model, 'weapon_model_path': args.weapon_model,
+                    'backend': args.backend, 'device': args.device}
+    timeline = scan_video(args.source, stride=args.stride, batch=args.batch, workers=args.workers,
+                          segment_seconds=args.segment_seconds, max_width=args.max_width, imgsz=args.imgsz,
+                          conf=args.conf, detector_cfg=detector_cfg,
+                          progress=lambda done, total: log.info("progress %d/%d frames", done, total))
+    if args.json:
+        write_json(timeline, args.json)
+    if args.db:
+        write_sqlite(timeline, f"sqlite:///{args.db}")
+    for i in timeline['incidents']:
+        print(f"{i['time']}  {i['level']:<10} {', '.join(i['reasons'])}  (until {timestamp(i['end'])})")
+    print(f"{timeline['duration']:.0f} s of video in {timeline['elapsed']:.0f} s, "
+          f"{len(timeline['incidents'])} incident(s)")
+
+
+if __name__ == '__main__':
+    main()
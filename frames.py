@@ -0,0 +1,44 @@
+import cv2
+from detectors import PersonWeaponDetector
+
+
+class AnnotatedFrame:
+    """
+    A decoded frame together with what should be drawn on it. The overlays are
+    rendered at most once, the first time a consumer (stream, snapshot, viewer)
+    asks for pixels, and JPEG encodes are cached per (quality, size) so every
+    consumer with the same settings shares one encode. With owned=True the frame
+    buffer belongs to this object and overlays are drawn into it without a copy.
+    Meant to be used from the thread that produced it.
+    """
+    def __init__(self, image, persons=(), weapons=(), tamper_res=None, action_res=None, owned=False):
+        self.image = image
+        self.persons = persons
+        self.weapons = weapons
+        self.tamper_res = tamper_res or {}
+        self.action_res = action_res or {}
+        self.owned = owned
+        self._annotated = None
+        self._jpeg = {}     # {(quality, size): bytes}
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    @property
+    def annotated(self):
+        if self._annotated is None:
+            self._annotated = PersonWeaponDetector.annotate_frame(
+                self.image, self.persons, self.weapons, self.tamper_res, self.action_res, copy=not self.owned)
+        return self._annotated
+
+    def jpeg(self, quality=90, size=None):
+        """Annotated frame as JPEG bytes, optionally resized to size=(w, h); None if encoding fails."""
+        key = (quality, size)
+        if key not in self._jpeg:
+            img = self.annotated
+            if size and (img.shape[1], img.shape[0]) != tuple(size):
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+            ret, buffer = cv2.imencode('.jpg', img, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+            self._jpeg[key] = buffer.tobytes() if ret else None
+        return self._jpeg[key]
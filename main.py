@@ -1,11 +1,21 @@
 # main.py
-import cv2, time, threading
+import cv2, time, threading, logging, os, socket
+from functools import partial
 from queue import Queue
 from detectors import PersonWeaponDetector
 from tamper import TamperDetector
 from action_detector import ActionDetector
+from tracker import Tracker
+from capture import FrameGrabber
+from scheduler import AdaptiveScheduler
 from decision import DecisionEngine
 from alerts import AlertManager
+from mp_pipeline import MultiprocessPipeline
+from frames import AnnotatedFrame
+from recorder import ClipRecorder
+from metrics import registry
+from model_registry import warm_detector
+from edge import EdgePublisher
 from flask import Flask
 import pkgutil, sys
 
@@ -15,64 +25,120 @@ import pkgutil, sys
 # VIDEO_SOURCE = 'test.mp4' 
 VIDEO_SOURCE = 'rtsp://admin:admin@'
 
-FRAME_QUEUE_MAX = 500
-
-def frame_reader(src, q):
-    cap = cv2.VideoCapture(src)
-    if not cap.isOpened():
-        print("ERROR: cannot open video source", src); return
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            time.sleep(0.05)
-            continue
-        if q.full():
-            # drop oldest to keep latest
-            try:
-                q.get_nowait()
-            except:
-                pass
-        q.put(frame)
-
-def detector_worker(q_in, q_out, detector, tamper, action_detector, decision_engine, alert_manager):
+FRAME_QUEUE_MAX = 2  # viewer only needs the newest annotated frames
+USE_PROCESSES = False  # capture / detection / pose in separate processes (mp_pipeline.py)
+DETECT_WORKERS = 2
+# edge mode: set ATM_CENTRAL=host:port (aggregator.py) to send detection records there
+# instead of alerting from this machine; ATM_EDGE_ID names this site
+CENTRAL = os.environ.get('ATM_CENTRAL')
+EDGE_ID = os.environ.get('ATM_EDGE_ID', socket.gethostname())
+STATS_EVERY = 300  # log per-stage latency every N frames (LOG_LEVEL=DEBUG also logs every frame)
+
+log = logging.getLogger(__name__)
+
+def log_stage_stats():
+    hists = registry.snapshot()['histograms'].get('stage_seconds', [])
+    log.info("stage p50/p95 ms: %s", " ".join(
+        f"{h['labels']['stage']}={h['p50'] * 1000:.1f}/{h['p95'] * 1000:.1f}" for h in hists if h['count']))
+
+def drop_oldest_put(q_out, frame):
+    # send annotated to output queue (for Flask streaming); the viewer only wants the newest
+    if q_out.full():
+        try:
+            q_out.get_nowait()
+            registry.inc('viewer_frames_dropped_total')
+        except: pass
+    q_out.put(frame)
+    registry.set('viewer_queue_depth', q_out.qsize())
+
+def detector_worker(source, q_out, detector, tamper, action_detector, decision_engine, alert_manager, tracker=None,
+                    scheduler=None, recorder=None, publisher=None):
+    # source: capture.FrameGrabber, always hands out the newest decoded frame
+    # publisher: edge.EdgePublisher; edge mode sends detection records to the aggregator,
+    # which owns alerting, and skips annotation, clips and alerts here
+    tracker = tracker or Tracker()
+    # run heavy detectors only when the scene calls for it (motion, people, rising score)
+    scheduler = scheduler or AdaptiveScheduler()
+    timed = partial(registry.timer, 'stage_seconds')
     frame_count = 0
-    process_every_n = 2  # process heavy detectors every 2 frames
-    while True:
-        frame = q_in.get()
+    while not source.finished:
+        with timed(stage='read'):
+            frame = source.read(timeout=1.0)
+        if frame is None:
+            continue
         frame_count += 1
+        log.debug("processing frame=%d", frame_count)
+        t_frame = time.perf_counter()
         # cheap tamper check every frame
-        tamper_res = tamper.check(frame)
+        with timed(stage='tamper'):
+            tamper_res = tamper.check(frame)
 
-        persons = []
         weapons = []
-        # run object detector every Nth frame to save CPU
-        if frame_count % process_every_n == 0:
-            objs = detector.predict(frame, imgsz=320, conf=0.35)
-            persons = detector.filter_by_class(objs, class_name='person')
+        ran = scheduler.should_infer(frame)
+        if ran:
+            t0 = time.monotonic()
+            with timed(stage='detect'):
+                objs = detector.predict(frame, imgsz=320, conf=0.35)
+            with timed(stage='track'):
+                persons = tracker.update(detector.filter_by_class(objs, class_name='person'))
             weapons = detector.filter_by_class(objs, class_name='weapon')  # if your weapon model has 'weapon' class
-        # tracking / ids handled inside detector (if SORT used)
+        else:
+            # skipped frame: keep tracked persons with Kalman-extrapolated boxes
+            with timed(stage='track'):
+                persons = tracker.predict()
 
         # pose/action analysis on cropped persons
-        action_res = action_detector.analyze(frame, persons)
-
-        decision = decision_engine.evaluate(persons, weapons, tamper_res, action_res)
-        annotated = detector.annotate_frame(frame, persons, weapons, tamper_res, action_res)
+        with timed(stage='action'):
+            action_res = action_detector.analyze(frame, persons)
+
+        with timed(stage='decision'):
+            decision = decision_engine.evaluate(persons, weapons, tamper_res, action_res, inferred=ran)
+        if ran:
+            scheduler.report(time.monotonic() - t0, persons=len(persons), score=decision.score)
+        if publisher:
+            with timed(stage='publish'):
+                publisher.publish(frame_count, time.time(), persons, weapons, tamper_res, action_res,
+                                  score=decision.score, inferred=ran)
+            registry.observe('frame_seconds', time.perf_counter() - t_frame)
+            registry.inc('frames_processed_total', inferred=ran)
+            continue
+        # drawn once, into the frame itself; snapshot encode and viewer share it
+        annotated = AnnotatedFrame(frame, persons, weapons, tamper_res, action_res, owned=True)
+        if recorder:
+            with timed(stage='record'):
+                recorder.add(annotated)
+        if recorder and decision.active:
+            # pre-roll + post-roll clip, extended while the incident is open
+            recorder.trigger('_'.join(decision.reasons) or 'alert')
         if decision.raise_alert:
             # Save and send annotated frame with detection boxes
+            with timed(stage='alert'):
+                alert_manager.send(decision, annotated)
+
+        with timed(stage='annotate'):
+            drop_oldest_put(q_out, annotated.annotated)
+        registry.observe('frame_seconds', time.perf_counter() - t_frame)
+        registry.inc('frames_processed_total', inferred=ran)
+        if frame_count % STATS_EVERY == 0:
+            log_stage_stats()
+
+def process_worker(workers, q_out, decision_engine, alert_manager):
+    # workers: mp_pipeline.MultiprocessPipeline; frames arrive already tracked and pose-analysed
+    for frame, meta in workers.results():
+        for stage, seconds in meta['timings'].items():
+            registry.observe('stage_seconds', seconds, stage=stage)
+        persons, weapons = meta['persons'], meta['weapons']
+        decision = decision_engine.evaluate(persons, weapons, meta['tamper'], meta['action'], inferred=meta['infer'])
+        if 'elapsed' in meta:
+            workers.report(meta['elapsed'], persons=len(persons), score=decision.score)
+        annotated = AnnotatedFrame(frame, persons, weapons, meta['tamper'], meta['action'], owned=True)
+        if decision.raise_alert:
             alert_manager.send(decision, annotated)
-
-        # annotate frame for dashboard
-        annotated = detector.annotate_frame(frame, persons, weapons, tamper_res, action_res)
-        # send annotated to output queue (for Flask streaming)
-        if q_out.full():
-            try:
-                q_out.get_nowait()
-            except: pass
-        q_out.put(annotated)
-        q_in.task_done()
+        drop_oldest_put(q_out, annotated.annotated)
+        registry.observe('frame_seconds', time.time() - meta['ts'])
+    workers.stop()
 
 def start_pipeline():
-    frame_q = Queue(maxsize=FRAME_QUEUE_MAX)
     out_q = Queue(maxsize=FRAME_QUEUE_MAX)
 
     
@@ -92,21 +158,39 @@ def start_pipeline():
         'to': ''
     }
 
+    if USE_PROCESSES:
+        workers = MultiprocessPipeline(VIDEO_SOURCE, capture_cfg={'max_age': 1.0},
+                                       detector_cfg={'person_model_path': "yolov8n.pt", 'weapon_model_path': "best.pt"},
+                                       detect_workers=DETECT_WORKERS).start()
+        alert_manager = AlertManager(twilio_cfg=twilio_cfg, smtp_cfg=smtp_cfg)
+        threading.Thread(target=process_worker, args=(workers, out_q, DecisionEngine(), alert_manager), daemon=True).start()
+        return out_q
+
     # instantiate modules
-    detector = PersonWeaponDetector(person_model_path="yolov8n.pt", weapon_model_path="best.pt")
+    # one dummy inference up front, so the first real frame isn't the slow one
+    detector = warm_detector(PersonWeaponDetector(person_model_path="yolov8n.pt", weapon_model_path="best.pt"))
     tamper = TamperDetector()
     action_detector = ActionDetector()
     decision_engine = DecisionEngine()
     alert_manager = AlertManager(twilio_cfg=twilio_cfg, smtp_cfg=smtp_cfg)
 
     # threads
-    threading.Thread(target=frame_reader, args=(VIDEO_SOURCE, frame_q), daemon=True).start()
-    threading.Thread(target=detector_worker, args=(frame_q, out_q, detector, tamper, action_detector, decision_engine, alert_manager), daemon=True).start()
+    grabber = FrameGrabber(VIDEO_SOURCE, max_age=1.0).start()
+    if CENTRAL:
+        publisher = EdgePublisher(CENTRAL, EDGE_ID, 'default')
+        threading.Thread(target=detector_worker, args=(grabber, out_q, detector, tamper, action_detector, decision_engine, None),
+                         kwargs={'publisher': publisher}, daemon=True).start()
+        return out_q
+    recorder = ClipRecorder()
+    threading.Thread(target=detector_worker, args=(grabber, out_q, detector, tamper, action_detector, decision_engine, alert_manager),
+                     kwargs={'recorder': recorder}, daemon=True).start()
 
     return out_q
 
 if __name__ == "__main__":
-    print("Starting pipeline...")
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    log.info("Starting pipeline...")
     out_q = start_pipeline()
 
     # minimal CLI viewer if user wants to see frames locally
@@ -0,0 +1,160 @@
+import time
+import bisect
+import threading
+from collections import deque
+
+# seconds; covers a fast tamper check up to a slow YOLO call or SMTP round trip
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('hist', 't0')
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class Histogram:
+    """Prometheus-style cumulative buckets, plus a small window of recent values for percentiles."""
+    def __init__(self, buckets, window=512):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def summary(self):
+        with self.lock:
+            recent = sorted(self.recent)
+            count, total = self.count, self.sum
+        out = {'count': count, 'mean': round(total / count, 6) if count else None}
+        for q in (50, 95, 99):
+            out[f'p{q}'] = round(recent[min(len(recent) - 1, len(recent) * q // 100)], 6) if recent else None
+        return out
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and histograms, keyed by name + labels.
+    Rendered as Prometheus text (render_prometheus) or a JSON-friendly dict (snapshot).
+    When disabled, timer() returns a shared no-op context manager and the other
+    record calls return immediately, so instrumented code pays almost nothing.
+    """
+    def __init__(self, enabled=True, prefix='atm_'):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.histograms = {}   # {(name, labels): Histogram}
+        self.counters = {}     # {(name, labels): float}
+        self.gauges = {}       # {(name, labels): float}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def _histogram(self, name, labels, buckets):
+        key = self._key(name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault(key, Histogram(buckets))
+        return hist
+
+    def timer(self, name, **labels):
+        """with registry.timer('stage_seconds', camera='cam1', stage='detect'): ..."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self._histogram(name, labels, LATENCY_BUCKETS))
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if self.enabled:
+            self._histogram(name, labels, buckets).observe(value)
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            key = self._key(name, labels)
+            with self.lock:
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if self.enabled:
+            self.gauges[self._key(name, labels)] = value
+
+    def _labels(self, labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+    def render_prometheus(self):
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# TYPE {self.prefix}{name} {kind}')
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, 'counter')
+            lines.append(f'{self.prefix}{name}{self._labels(labels)} {value}')
+        for (name, labels), value in sorted(self.gauges.items()):
+            header(name, 'gauge')
+            lines.append(f'{self.prefix}{name}{self._labels(labels)} {value}')
+        for (name, labels), hist in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+            header(name, 'histogram')
+            with hist.lock:
+                counts, total, count = list(hist.counts), hist.sum, hist.count
+            cumulative = 0
+            for bound, c in zip(list(hist.buckets) + ['+Inf'], counts):
+                cumulative += c
+                lines.append(f'{self.prefix}{name}_bucket{self._labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.prefix}{name}_sum{self._labels(labels)} {total}')
+            lines.append(f'{self.prefix}{name}_count{self._labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        def group(items, fn):
+            out = {}
+            for (name, labels), value in sorted(items, key=lambda kv: kv[0]):
+                out.setdefault(name, []).append(dict(labels=dict(labels), **fn(value)))
+            return out
+        return {
+            'enabled': self.enabled,
+            'counters': group(self.counters.items(), lambda v: {'value': v}),
+            'gauges': group(self.gauges.items(), lambda v: {'value': v}),
+            'histograms': group(self.histograms.items(), lambda h: h.summary()),
+        }
+
+
+# process-wide registry; app.py exposes it at /metrics and /stats
+registry = MetricsRegistry()
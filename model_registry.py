@@ -0,0 +1,115 @@
+import time
+import logging
+import threading
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Process-wide home for loaded models.
+    get(name, factory) builds each model once, on first use, under a per-name lock
+    (concurrent callers wait for that load rather than starting a second one) and keeps
+    it for the life of the process, so stopping and restarting a pipeline costs no
+    reload. warm_up() runs the same loads on a background thread at boot.
+    """
+    def __init__(self):
+        self._models = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.load_times = {}   # {name: seconds spent in factory()}
+
+    def get(self, name, factory):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._models:
+                t0 = time.monotonic()
+                self._models[name] = factory()
+                self.load_times[name] = round(time.monotonic() - t0, 3)
+                log.info("loaded model=%s seconds=%.2f", name, self.load_times[name])
+        return self._models[name]
+
+    def loaded(self, name):
+        return name in self._models
+
+    def drop(self, name):
+        """Forget a model (e.g. after a config change); the next get() reloads it."""
+        with self._lock:
+            self._models.pop(name, None)
+
+    def warm_up(self, *loaders):
+        """Runs loaders (zero-argument callables that go through get()) in order on a background thread."""
+        def run():
+            for loader in loaders:
+                try:
+                    loader()
+                except Exception as e:
+                    log.error("model warm-up failed in %s: %s", getattr(loader, '__name__', loader), e)
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        return {'loaded': sorted(self._models), 'load_seconds': dict(self.load_times)}
+
+
+def mediapipe_pose(min_detection_confidence=0.5):
+    import mediapipe as mp   # deferred: importing mediapipe alone takes seconds
+    return mp.solutions.pose.Pose(static_image_mode=False, min_detection_confidence=min_detection_confidence)
+
+
+class PosePool:
+    """
+    Idle pose contexts (MediaPipe Pose graphs by default) kept for reuse.
+    Building a graph costs far more than resetting one, so contexts released by a
+    pipeline (track gone, camera stopped) come back here instead of being closed;
+    at most max_idle are kept.
+    """
+    def __init__(self, factory=None, max_idle=16):
+        self.factory = factory or mediapipe_pose
+        self.max_idle = max_idle
+        self.idle = []
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        self.created += 1
+        return self.factory()
+
+    def release(self, ctx):
+        # drop the previous person's temporal state before someone else gets the graph
+        reset = getattr(ctx, 'reset', None)
+        if reset:
+            reset()
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(ctx)
+                return
+        ctx.close()
+
+    def warm(self, n=1, size=(128, 256)):
+        """Create n contexts and push one blank crop through each, so the first track pays nothing."""
+        ctxs = [self.acquire() for _ in range(n)]
+        for ctx in ctxs:
+            ctx.process(np.zeros((size[1], size[0], 3), dtype=np.uint8))
+        for ctx in ctxs:
+            self.release(ctx)
+        return self
+
+
+def warm_detector(detector, imgsz=320, size=(640, 360)):
+    """One dummy inference so weights are paged in and the runtime has set up its kernels/threads."""
+    detector.predict(np.zeros((size[1], size[0], 3), dtype=np.uint8), imgsz=imgsz)
+    return detector
+
+
+# process-wide instance shared by every pipeline in this process
+models = ModelRegistry()
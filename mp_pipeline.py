@@ -0,0 +1,287 @@
+import time
+import heapq
+import multiprocessing
+from multiprocessing import shared_memory
+from queue import Empty, Full
+import numpy as np
+import cv2
+
+# Process layout for one camera:
+#   capture (decode, tamper, scheduling) -> N x detect (YOLO) -> action (tracking, pose)
+#   -> parent process (decision, annotation, alerts, streaming)
+# Frames are written once into a shared-memory ring; queues carry only small metadata
+# dicts ({'slot', 'seq', ...} plus detections), never pixel data. Each stage adds its
+# duration to meta['timings'] so the parent can export per-stage latencies.
+
+
+class SharedFrameRing:
+    """
+    Fixed-size ring of frame slots in multiprocessing.shared_memory.
+    One process writes; any process can read a slot by (slot, seq). Each slot has a
+    header [seq, h, w, c]; a read is only returned if the slot still holds the same
+    seq after the copy (seqlock), so a lapped slot is detected instead of torn.
+    """
+    def __init__(self, slots, max_shape, name=None, create=False):
+        self.slots = slots
+        self.max_shape = tuple(max_shape)
+        self.slot_bytes = int(np.prod(self.max_shape))
+        header_bytes = slots * 4 * 8
+        size = header_bytes + slots * self.slot_bytes
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.header = np.ndarray((slots, 4), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=self.shm.buf, offset=header_bytes)
+        if create:
+            self.header[:] = -1
+        self.next_seq = 0
+
+    @property
+    def spec(self):
+        """Everything another process needs to attach()."""
+        return {'name': self.shm.name, 'slots': self.slots, 'max_shape': self.max_shape}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec['slots'], spec['max_shape'], name=spec['name'])
+
+    def write(self, frame):
+        mh, mw, _ = self.max_shape
+        h, w = frame.shape[:2]
+        if h > mh or w > mw:
+            r = min(mh / h, mw / w)
+            frame = cv2.resize(frame, (int(w * r), int(h * r)), interpolation=cv2.INTER_AREA)
+        seq = self.next_seq
+        self.next_seq += 1
+        slot = seq % self.slots
+        self.header[slot, 0] = -1   # mark as being written
+        self.data[slot, :frame.size] = frame.reshape(-1)
+        self.header[slot, 1:] = frame.shape
+        self.header[slot, 0] = seq
+        return slot, seq
+
+    def read(self, slot, seq):
+        if self.header[slot, 0] != seq:
+            return None
+        h, w, c = self.header[slot, 1:]
+        frame = self.data[slot, :h * w * c].reshape(h, w, c).copy()
+        if self.header[slot, 0] != seq:
+            return None
+        return frame
+
+    def close(self):
+        self.header = self.data = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _capture_main(src, ring_spec, det_q, feedback_q, stop, frames, dropped, n_detectors, capture_cfg, scheduler_cfg):
+    from capture import FrameGrabber
+    from tamper import TamperDetector
+    from scheduler import AdaptiveScheduler
+    ring = SharedFrameRing.attach(ring_spec)
+    grabber = FrameGrabber(src, **capture_cfg).start()
+    tamper = TamperDetector()
+    scheduler = AdaptiveScheduler(**scheduler_cfg)
+    while not stop.is_set():
+        frame = grabber.read(timeout=1.0)
+        if frame is None:
+            if grabber.finished:
+                break
+            continue
+        frames.value += 1
+        # decision-stage feedback for the scheduler: (elapsed, persons, score)
+        while True:
+            try:
+                scheduler.report(*feedback_q.get_nowait())
+            except Empty:
+                break
+        if det_q.full():
+            # pipeline is behind: drop at the entrance rather than queueing stale frames
+            dropped.value += 1
+            continue
+        t0 = time.perf_counter()
+        tamper_res = tamper.check(frame)
+        t1 = time.perf_counter()
+        infer = scheduler.should_infer(frame)
+        t2 = time.perf_counter()
+        slot, seq = ring.write(frame)
+        timings = {'tamper': t1 - t0, 'schedule': t2 - t1, 'ring_write': time.perf_counter() - t2}
+        det_q.put({'slot': slot, 'seq': seq, 'ts': time.time(), 'infer': infer, 'tamper': tamper_res,
+                   'timings': timings})
+    grabber.stop()
+    for _ in range(n_detectors):
+        det_q.put(None)
+    ring.close()
+
+
+def _detect_main(ring_spec, det_q, action_q, detector_cfg, imgsz, conf, roi):
+    from detectors import PersonWeaponDetector
+    from roi import RegionOfInterest
+    from model_registry import warm_detector
+    ring = SharedFrameRing.attach(ring_spec)
+    detector = PersonWeaponDetector(**detector_cfg)
+    warm_detector(detector, imgsz=imgsz)
+    roi = RegionOfInterest(roi) if roi else None
+    while True:
+        meta = det_q.get()
+        if meta is None:
+            action_q.put(None)
+            break
+        if meta['infer']:
+            frame = ring.read(meta['slot'], meta['seq'])
+            if frame is not None:
+                t0 = time.monotonic()
+                if roi:
+                    sub, (dx, dy) = roi.crop(frame)
+                    objs = []
+                    if sub is not None:
+                        objs = detector.predict(sub, imgsz=imgsz, conf=conf, as_arrays=True)
+                        objs = roi.filter(detector.shift(objs, dx, dy), frame.shape)
+                else:
+                    objs = detector.predict(frame, imgsz=imgsz, conf=conf, as_arrays=True)
+                meta['persons'] = detector.filter_by_class(objs, class_name='person')
+                meta['weapons'] = detector.filter_by_class(objs, class_name='weapon')
+                meta['elapsed'] = meta['timings']['detect'] = time.monotonic() - t0
+        action_q.put(meta)
+    ring.close()
+
+
+def _action_main(ring_spec, action_q, out_q, n_detectors, action_cfg, reorder_max, reorder_timeout):
+    from tracker import Tracker
+    from action_detector import ActionDetector
+    ring = SharedFrameRing.attach(ring_spec)
+    tracker = Tracker()
+    action_detector = ActionDetector(**action_cfg)
+    pending = []          # heap of (seq, meta): detect workers may finish out of order
+    expected = 0
+    waiting_since = None
+    ended = 0
+    while ended < n_detectors or pending:
+        try:
+            meta = action_q.get(timeout=reorder_timeout) if ended < n_detectors else None
+            if meta is None and ended < n_detectors:
+                ended += 1
+            elif meta is not None:
+                heapq.heappush(pending, (meta['seq'], meta))
+        except Empty:
+            pass
+        if pending and pending[0][0] != expected:
+            waiting_since = waiting_since or time.monotonic()
+            if (len(pending) > reorder_max or ended == n_detectors
+                    or time.monotonic() - waiting_since > reorder_timeout):
+                expected = pending[0][0]   # give up on the missing seq
+        while pending and pending[0][0] == expected:
+            _, meta = heapq.heappop(pending)
+            expected += 1
+            waiting_since = None
+            t0 = time.perf_counter()
+            if 'persons' in meta:
+                persons = tracker.update(meta['persons'])
+            else:
+                persons = tracker.predict()
+                meta['weapons'] = []
+            t1 = time.perf_counter()
+            frame = ring.read(meta['slot'], meta['seq'])
+            meta['persons'] = persons
+            meta['action'] = (action_detector.analyze(frame, persons) if frame is not None
+                              else {'actions': [], 'loitering': False})
+            meta['timings'].update(track=t1 - t0, action=time.perf_counter() - t1)
+            out_q.put(meta)
+    out_q.put(None)
+    ring.close()
+
+
+class MultiprocessPipeline:
+    """
+    Runs capture, detection (detect_workers processes) and tracking/pose for one camera
+    in separate processes. The parent iterates results() and does the decision,
+    annotation, alerting and streaming, then feeds report() back to the scheduler.
+    Each detect worker loads its own copy of the models.
+    """
+    def __init__(self, video_source, roi=None, detector_cfg=None, capture_cfg=None, scheduler_cfg=None, action_cfg=None,
+                 imgsz=320, conf=0.35, detect_workers=2, queue_size=4, reorder_max=8, reorder_timeout=0.5,
+                 max_shape=(1080, 1920, 3), start_method='spawn'):
+        self.video_source = video_source
+        self.roi = roi
+        self.detector_cfg = detector_cfg or {}
+        self.capture_cfg = capture_cfg or {}
+        self.scheduler_cfg = scheduler_cfg or {}
+        self.action_cfg = action_cfg or {}
+        self.imgsz = imgsz
+        self.conf = conf
+        self.detect_workers = detect_workers
+        self.queue_size = queue_size
+        self.reorder_max = reorder_max
+        self.reorder_timeout = reorder_timeout
+        # enough slots that a frame can't be overwritten while still queued anywhere
+        self.ring_slots = 3 * queue_size + detect_workers + reorder_max + 2
+        self.max_shape = max_shape
+        self.ctx = multiprocessing.get_context(start_method)
+        self.ring = None
+        self.procs = []
+
+    def start(self):
+        ctx = self.ctx
+        self.ring = SharedFrameRing(self.ring_slots, self.max_shape, create=True)
+        spec = self.ring.spec
+        self.stop_event = ctx.Event()
+        self.det_q = ctx.Queue(self.queue_size)
+        self.action_q = ctx.Queue(self.queue_size)
+        self.out_q = ctx.Queue(self.queue_size)
+        self.feedback_q = ctx.Queue(64)
+        self._frames = ctx.Value('q', 0)
+        self._dropped = ctx.Value('q', 0)
+        self.procs = [ctx.Process(target=_capture_main, name='capture', daemon=True,
+                                  args=(self.video_source, spec, self.det_q, self.feedback_q, self.stop_event,
+                                        self._frames, self._dropped, self.detect_workers,
+                                        self.capture_cfg, self.scheduler_cfg))]
+        self.procs += [ctx.Process(target=_detect_main, name=f'detect-{i}', daemon=True,
+                                   args=(spec, self.det_q, self.action_q, self.detector_cfg, self.imgsz, self.conf, self.roi))
+                       for i in range(self.detect_workers)]
+        self.procs.append(ctx.Process(target=_action_main, name='action', daemon=True,
+                                      args=(spec, self.action_q, self.out_q, self.detect_workers, self.action_cfg,
+                                            self.reorder_max, self.reorder_timeout)))
+        for p in self.procs:
+            p.start()
+        return self
+
+    def results(self, timeout=1.0):
+        """Yields (frame, meta) in frame order; meta has 'tamper', 'persons', 'weapons', 'action'."""
+        while True:
+            try:
+                meta = self.out_q.get(timeout=timeout)
+            except Empty:
+                if self.stop_event.is_set() or not any(p.is_alive() for p in self.procs):
+                    return
+                continue
+            if meta is None:
+                return
+            frame = self.ring.read(meta['slot'], meta['seq'])
+            if frame is not None:
+                yield frame, meta
+
+    def report(self, elapsed, persons=0, score=0.0):
+        try:
+            self.feedback_q.put_nowait((elapsed, persons, score))
+        except Full:
+            pass
+
+    def stats(self):
+        return {
+            'frames': self._frames.value,
+            'dropped': self._dropped.value,
+            'alive': [p.name for p in self.procs if p.is_alive()],
+        }
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        for p in self.procs:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring.unlink()
+            self.ring = None
+
@@ -0,0 +1,73 @@
+import cv2
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from model_registry import PosePool, mediapipe_pose
+
+
+class TrackPoseEstimator:
+    """
+    Runs MediaPipe pose per tracked person.
+    Each track id gets its own Pose context, so temporal smoothing follows one person
+    instead of being fed crops of different people. Pose is only re-run for a track
+    every `every_k` frames, or sooner when its motion exceeds `motion_thresh`;
+    in between the last landmarks are reused. Crops are processed on a thread pool.
+    Contexts come from pose_pool (a model_registry.PosePool, shareable across pipelines)
+    and go back to it when a track is dropped, instead of being rebuilt per track.
+    pose_factory() may replace MediaPipe with any object offering process(rgb) and close().
+    """
+    def __init__(self, every_k=5, motion_thresh=20.0, workers=2, max_contexts=8, min_detection_confidence=0.5,
+                 pose_factory=None, pose_pool=None):
+        self.every_k = every_k
+        self.motion_thresh = motion_thresh
+        self.max_contexts = max_contexts
+        self.min_detection_confidence = min_detection_confidence
+        self.pose_pool = pose_pool or PosePool(
+            pose_factory or (lambda: mediapipe_pose(self.min_detection_confidence)), max_idle=max_contexts)
+        self.contexts = OrderedDict()  # {track_id: pose context}, least recently used first
+        self.last_run = {}             # {track_id: frame index of last pose run}
+        self.landmarks = {}            # {track_id: last pose_landmarks or None}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pose")
+
+    def due(self, track_id, frame_idx, motion=0.0):
+        last = self.last_run.get(track_id)
+        return last is None or frame_idx - last >= self.every_k or motion > self.motion_thresh
+
+    def _prepare_contexts(self, track_ids):
+        # called from the caller's thread before dispatch, so no context is evicted while in use
+        for tid in track_ids:
+            if tid in self.contexts:
+                self.contexts.move_to_end(tid)
+            else:
+                self.contexts[tid] = self.pose_pool.acquire()
+        for tid in [t for t in self.contexts if t not in track_ids]:
+            if len(self.contexts) <= self.max_contexts:
+                break
+            # the track keeps its last landmarks; it just loses temporal smoothing
+            self.pose_pool.release(self.contexts.pop(tid))
+
+    def _process(self, ctx, crop):
+        return ctx.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)).pose_landmarks
+
+    def run(self, jobs, frame_idx):
+        """jobs: {track_id: BGR crop}; blocks until all crops are processed."""
+        self._prepare_contexts(jobs)
+        futures = {tid: self.pool.submit(self._process, self.contexts[tid], crop) for tid, crop in jobs.items()}
+        for tid, fut in futures.items():
+            self.landmarks[tid] = fut.result()
+            self.last_run[tid] = frame_idx
+
+    def latest(self, track_id):
+        return self.landmarks.get(track_id)
+
+    def forget(self, track_id):
+        self.last_run.pop(track_id, None)
+        self.landmarks.pop(track_id, None)
+        ctx = self.contexts.pop(track_id, None)
+        if ctx is not None:
+            self.pose_pool.release(ctx)
+
+    def close(self):
+        """Hands every context back to the pool (e.g. when the pipeline stops)."""
+        self.pool.shutdown(wait=True)
+        while self.contexts:
+            self.pose_pool.release(self.contexts.popitem()[1])
@@ -0,0 +1,147 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from queue import Queue
+from datetime import datetime
+import cv2
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class ClipRecorder:
+    """
+    Per-camera pre-event buffer and alert clip writer.
+    add() keeps the last `pre_roll` seconds as JPEGs in a ring capped at `max_bytes`
+    (oldest frames go first, whatever the resolution or scene complexity); post-roll
+    is capped the same way, so one camera holds at most 2 * max_bytes. trigger()
+    starts a clip from that pre-roll and keeps appending frames until `post_roll`
+    seconds after the last trigger; the finished clip is decoded and written by a
+    background thread, so the pipeline never waits on the video encoder.
+    """
+    def __init__(self, clip_dir='clips', pre_roll=10.0, post_roll=10.0, max_bytes=32 * 1024 * 1024,
+                 max_clip_seconds=60.0, quality=70, size=(640, 360), every_n=1, fourcc='mp4v', ext='.mp4'):
+        os.makedirs(clip_dir, exist_ok=True)
+        self.clip_dir = clip_dir
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_bytes = max_bytes
+        self.max_clip_seconds = max_clip_seconds
+        self.quality = quality
+        self.size = size            # (w, h) frames are stored at; same as the stream shares its encode
+        self.every_n = every_n
+        self.fourcc = fourcc
+        self.ext = ext
+        self.ring = deque()         # (timestamp, jpeg bytes)
+        self.ring_bytes = 0
+        self.active = None          # clip being collected: {'path', 'frames', 'bytes', 'until', 'start'}
+        self.frame_count = 0
+        self.clips_written = 0
+        self.jobs = Queue()
+        self.lock = threading.Lock()
+        threading.Thread(target=self._writer, name="clip-writer", daemon=True).start()
+
+    def _encode(self, frame):
+        if hasattr(frame, 'jpeg'):
+            # frames.AnnotatedFrame: shares the encode with the stream when settings match
+            return frame.jpeg(self.quality, self.size)
+        if self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        return buffer.tobytes() if ret else None
+
+    def add(self, frame, ts=None):
+        self.frame_count += 1
+        if (self.frame_count - 1) % self.every_n != 0:
+            return
+        ts = time.time() if ts is None else ts
+        jpeg = self._encode(frame)
+        if jpeg is None:
+            return
+        with self.lock:
+            self.ring.append((ts, jpeg))
+            self.ring_bytes += len(jpeg)
+            while self.ring and (self.ring_bytes > self.max_bytes or ts - self.ring[0][0] > self.pre_roll):
+                self.ring_bytes -= len(self.ring.popleft()[1])
+            clip = self.active
+            if clip is None:
+                return
+            if clip['bytes'] + len(jpeg) <= self.max_bytes:
+                clip['frames'].append((ts, jpeg))
+                clip['bytes'] += len(jpeg)
+            if ts >= clip['until']:
+                self.active = None
+                self.jobs.put(clip)
+
+    def trigger(self, label='alert', ts=None):
+        """Start (or extend) a clip around now; returns the path it will be written to."""
+        ts = time.time() if ts is None else ts
+        with self.lock:
+            clip = self.active
+            if clip is not None:
+                # overlapping incidents extend one clip instead of writing several
+                clip['until'] = min(ts + self.post_roll, clip['start'] + self.max_clip_seconds)
+                return clip['path']
+            now = datetime.utcnow()
+            name = f"{label}_{now.strftime('%Y%m%dT%H%M%S')}{now.microsecond // 1000:03d}Z{self.ext}"
+            frames = list(self.ring)
+            start = frames[0][0] if frames else ts
+            self.active = {
+                'path': os.path.join(self.clip_dir, name),
+                'frames': frames,
+                'bytes': 0,         # post-roll bytes; capped at max_bytes like the ring
+                'start': start,
+                'until': min(ts + self.post_roll, start + self.max_clip_seconds),
+            }
+            return self.active['path']
+
+    def close(self):
+        """Write out a clip still collecting post-roll and stop the writer."""
+        with self.lock:
+            clip, self.active = self.active, None
+        if clip is not None:
+            self.jobs.put(clip)
+        self.jobs.put(None)
+
+    def _writer(self):
+        while True:
+            clip = self.jobs.get()
+            if clip is None:
+                return
+            try:
+                self._write(clip)
+                self.clips_written += 1
+            except Exception as e:
+                log.error("could not write clip %s: %s", clip['path'], e)
+
+    def _write(self, clip):
+        frames = clip['frames']
+        if not frames:
+            return
+        span = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / span if span > 0 else 10.0
+        writer = None
+        for ts, jpeg in frames:
+            img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            if writer is None:
+                h, w = img.shape[:2]
+                writer = cv2.VideoWriter(clip['path'], cv2.VideoWriter_fourcc(*self.fourcc), fps, (w, h))
+                if not writer.isOpened():
+                    raise IOError(f"VideoWriter could not open {self.fourcc}")
+            writer.write(img)
+        if writer is not None:
+            writer.release()
+        log.info("clip saved path=%s frames=%d seconds=%.1f", clip['path'], len(frames), span)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'buffered_frames': len(self.ring),
+                'buffered_bytes': self.ring_bytes,
+                'recording': self.active is not None,
+                'clips_written': self.clips_written,
+            }
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+from detectors import Detections
+
+
+class RegionOfInterest:
+    """
+    Per-camera regions (e.g. ATM fascia, keypad, queue area) as polygons in frame pixels:
+    {'keypad': [(x, y), ...], 'queue': [(x, y), ...]}
+    crop() cuts the frame down to the bounding rectangle of all regions before inference;
+    filter() keeps only detections whose box centre lies inside one of the polygons.
+    """
+    def __init__(self, regions):
+        self.regions = {name: np.asarray(pts, dtype=np.int32).reshape(-1, 2) for name, pts in regions.items()}
+        self._mask = None
+        self._mask_shape = None
+
+    def mask(self, shape):
+        # label image: 0 outside, i+1 inside the i-th region; rebuilt only if the frame size changes
+        if self._mask is None or self._mask_shape != shape[:2]:
+            self._mask = np.zeros(shape[:2], dtype=np.uint8)
+            for i, pts in enumerate(self.regions.values()):
+                cv2.fillPoly(self._mask, [pts], i + 1)
+            self._mask_shape = shape[:2]
+        return self._mask
+
+    def bounds(self, shape):
+        pts = np.concatenate(list(self.regions.values()))
+        h, w = shape[:2]
+        x1, y1 = np.clip(pts.min(axis=0), 0, [w, h])
+        x2, y2 = np.clip(pts.max(axis=0), 0, [w, h])
+        return int(x1), int(y1), int(x2), int(y2)
+
+    def crop(self, frame):
+        """
+        returns: (sub-image, (dx, dy)) -- shift detections by (dx, dy) to map them back;
+        (None, (dx, dy)) if no region overlaps the frame (e.g. after a resolution change),
+        in which case nothing can be detected inside them
+        """
+        x1, y1, x2, y2 = self.bounds(frame.shape)
+        if x2 <= x1 or y2 <= y1:
+            return None, (x1, y1)
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def zones(self, boxes, shape):
+        """Region index + 1 for each box centre (0 = outside every region)."""
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        h, w = shape[:2]
+        cx = np.clip((boxes[:, 0] + boxes[:, 2]) // 2, 0, w - 1)
+        cy = np.clip((boxes[:, 1] + boxes[:, 3]) // 2, 0, h - 1)
+        return self.mask(shape)[cy, cx]
+
+    def filter(self, objs, shape):
+        if isinstance(objs, Detections):
+            return objs[self.zones(objs.boxes, shape) > 0]
+        if not objs:
+            return objs
+        inside = self.zones([o['box'] for o in objs], shape) > 0
+        return [o for o, keep in zip(objs, inside) if keep]
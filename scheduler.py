@@ -0,0 +1,82 @@
+import time
+import cv2
+import numpy as np
+
+
+class AdaptiveScheduler:
+    """
+    Decides, per camera and per frame, whether the heavy detectors should run.
+    A cheap frame-difference score on a small thumbnail keeps a static scene at
+    `idle_interval` (a slow heartbeat); motion raises the rate to `motion_interval`;
+    people in view or a rising decision score raise it to `active_interval` for
+    `hold` seconds. The interval never drops below what fits `cpu_budget`, the
+    fraction of one core this camera's inference may use on average.
+    """
+    def __init__(self, idle_interval=2.0, motion_interval=0.2, active_interval=0.0, hold=5.0,
+                 motion_thresh=3.0, cpu_budget=0.5, thumb_size=(64, 36)):
+        self.idle_interval = idle_interval
+        self.motion_interval = motion_interval
+        self.active_interval = active_interval
+        self.hold = hold
+        self.motion_thresh = motion_thresh
+        self.cpu_budget = cpu_budget
+        self.thumb_size = thumb_size
+        self.prev_thumb = None
+        self.motion = 0.0
+        self.last_run = 0.0
+        self.active_until = 0.0
+        self.motion_until = 0.0
+        self.cost = 0.0          # EMA of inference seconds per run
+        self.last_score = 0.0
+        self.runs = 0
+        self.skips = 0
+
+    def motion_score(self, frame):
+        step = max(1, frame.shape[1] // (self.thumb_size[0] * 4))
+        thumb = cv2.resize(frame[::step, ::step], self.thumb_size, interpolation=cv2.INTER_AREA)
+        thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY).astype(np.int16)
+        score = 0.0 if self.prev_thumb is None else float(np.abs(thumb - self.prev_thumb).mean())
+        self.prev_thumb = thumb
+        return score
+
+    def interval(self, now):
+        if now < self.active_until:
+            interval = self.active_interval
+        elif now < self.motion_until:
+            interval = self.motion_interval
+        else:
+            interval = self.idle_interval
+        if self.cpu_budget:
+            interval = max(interval, self.cost / self.cpu_budget)
+        return interval
+
+    def should_infer(self, frame, now=None):
+        now = time.monotonic() if now is None else now
+        self.motion = self.motion_score(frame)
+        if self.motion > self.motion_thresh:
+            self.motion_until = now + self.hold
+        if now - self.last_run >= self.interval(now):
+            self.last_run = now
+            self.runs += 1
+            return True
+        self.skips += 1
+        return False
+
+    def report(self, elapsed, persons=0, score=0.0, now=None):
+        """Feed back one inference run: its cost, people found and the decision score."""
+        now = time.monotonic() if now is None else now
+        self.cost = elapsed if not self.cost else 0.8 * self.cost + 0.2 * elapsed
+        if persons or score > self.last_score:
+            self.active_until = now + self.hold
+        self.last_score = score
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'mode': 'active' if now < self.active_until else 'motion' if now < self.motion_until else 'idle',
+            'motion': round(self.motion, 2),
+            'interval': round(self.interval(now), 3),
+            'inference_cost': round(self.cost, 4),
+            'runs': self.runs,
+            'skips': self.skips,
+        }
@@ -0,0 +1,239 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from queue import Queue, Empty, Full
+import cv2
+from sqlalchemy import (create_engine, event, MetaData, Table, Column, Integer, Float, String, Text,
+                        Index, select, func, delete)
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+snapshots_table = Table(
+    'snapshots', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('path', Text, nullable=False, unique=True),
+    Column('thumb_path', Text),
+    Column('camera_id', String(64), nullable=False),
+    Column('label', Text),
+    Column('alert_id', Integer),
+    Column('created', Float, nullable=False),
+    Column('bytes', Integer, nullable=False),   # snapshot + thumbnail
+    Index('ix_snapshots_created', 'created'),
+    Index('ix_snapshots_camera_id', 'camera_id', 'id'),
+)
+
+
+class SnapshotStore:
+    """
+    Alert snapshots on disk, sharded as <root>/<YYYY-MM-DD>/<camera_id>/, with a
+    small thumbnail next to each one and a SQLite index of what is stored.
+    save() returns the final path straight away and leaves the file writes (and any
+    JPEG encode the caller didn't supply) to a writer thread (wait(path) blocks until
+    a file exists, e.g. before it is attached to an email). The same thread enforces the
+    retention policy every sweep_interval seconds: snapshots older than max_age_days
+    go first, then the oldest until the store is under max_bytes.
+    on_saved(record, jpeg_bytes) is called from the writer thread after each write.
+    """
+    def __init__(self, root='snapshots', max_bytes=512 * 1024 * 1024, max_age_days=30, quality=85,
+                 max_width=1280, thumb_width=320, thumb_quality=60, sweep_interval=60.0, queue_size=32,
+                 index_url=None, on_saved=None):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.quality = quality
+        self.max_width = max_width
+        self.thumb_width = thumb_width
+        self.thumb_quality = thumb_quality
+        self.sweep_interval = sweep_interval
+        self.on_saved = on_saved
+        self.engine = create_engine(index_url or f"sqlite:///{os.path.join(root, 'index.db')}",
+                                    connect_args={'check_same_thread': False})
+        event.listen(self.engine, 'connect', self._sqlite_pragmas)
+        metadata.create_all(self.engine)
+        self.pending = {}   # {path: threading.Event set once the file is written}
+        self.lock = threading.Lock()
+        self.jobs = Queue(maxsize=queue_size)
+        self.evicted = 0
+        self._import_unindexed()
+        threading.Thread(target=self._worker, name="snapshot-store", daemon=True).start()
+
+    @staticmethod
+    def _sqlite_pragmas(dbapi_conn, _):
+        cur = dbapi_conn.cursor()
+        cur.execute('PRAGMA journal_mode=WAL')
+        cur.execute('PRAGMA synchronous=NORMAL')
+        cur.close()
+
+    def _import_unindexed(self):
+        # snapshots written before the index existed (flat files in root) fall under retention too
+        with self.engine.connect() as conn:
+            if conn.execute(select(func.count()).select_from(snapshots_table)).scalar():
+                return
+        rows = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith('.jpg') and os.path.isfile(path):
+                st = os.stat(path)
+                rows.append({'path': path, 'camera_id': 'default', 'label': name[:-4],
+                             'created': st.st_mtime, 'bytes': st.st_size})
+        if rows:
+            with self.engine.begin() as conn:
+                conn.execute(snapshots_table.insert(), rows)
+            log.info("indexed %d existing snapshots in %s", len(rows), self.root)
+
+    @staticmethod
+    def thumb_path(path):
+        return path[:-len('.jpg')] + '_thumb.jpg'
+
+    def fit(self, shape, width):
+        """(w, h) an image of this shape is downscaled to for `width`; None if it already fits."""
+        h, w = shape[:2]
+        return (width, int(h * width / w)) if width and w > width else None
+
+    def save(self, image, camera_id=None, label='alert', alert_id=None, ts=None, jpeg=None, thumb=None):
+        """
+        image: BGR frame, which must not be modified afterwards (it may be encoded later).
+        jpeg, thumb: the snapshot and thumbnail already encoded at quality/fit(max_width)
+        and thumb_quality/fit(thumb_width); whichever is missing is encoded from image.
+        returns: path the snapshot will be written to
+        """
+        ts = ts or time.time()
+        camera_id = camera_id or 'default'
+        now = datetime.utcfromtimestamp(ts)
+        shard = os.path.join(self.root, now.strftime('%Y-%m-%d'), camera_id)
+        # millisecond resolution so alerts within the same second don't overwrite each other
+        stem = os.path.join(shard, f"{label}_{now.strftime('%Y%m%dT%H%M%S')}{now.microsecond // 1000:03d}Z")
+        with self.lock:
+            path, n = f"{stem}.jpg", 1
+            while path in self.pending or os.path.exists(path):
+                path, n = f"{stem}-{n}.jpg", n + 1
+            self.pending[path] = threading.Event()
+        job = (image, jpeg, thumb, path, {'camera_id': camera_id, 'label': label, 'alert_id': alert_id, 'created': ts})
+        try:
+            self.jobs.put_nowait(job)
+        except Full:
+            # back-pressure rather than losing an alert's evidence
+            log.warning("snapshot queue full; writing inline path=%s", path)
+            self._write(*job)
+        return path
+
+    def wait(self, path, timeout=5.0):
+        """True once the snapshot at path is on disk."""
+        done = self.pending.get(path)
+        if done is not None:
+            return done.wait(timeout)
+        return os.path.exists(path)
+
+    def _encode(self, image, width, quality):
+        size = self.fit(image.shape, width)
+        if size:
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        if not ok:
+            raise ValueError("JPEG encode failed")
+        return buf.tobytes()
+
+    def _write(self, image, data, thumb, path, record):
+        t0 = time.perf_counter()
+        try:
+            data = data or self._encode(image, self.max_width, self.quality)
+            thumb = thumb or self._encode(image, self.thumb_width, self.thumb_quality)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            thumb_path = self.thumb_path(path)
+            for p, b in ((path, data), (thumb_path, thumb)):
+                with open(p, 'wb') as f:
+                    f.write(b)
+            record = dict(record, path=path, thumb_path=thumb_path, bytes=len(data) + len(thumb))
+            with self.engine.begin() as conn:
+                conn.execute(snapshots_table.insert(), [record])
+        except Exception as e:
+            log.error("snapshot write failed path=%s: %s", path, e)
+            return
+        finally:
+            with self.lock:
+                done = self.pending.pop(path, None)
+            if done:
+                done.set()
+        registry.observe('snapshot_write_seconds', time.perf_counter() - t0)
+        if self.on_saved:
+            try:
+                self.on_saved(record, data)
+            except Exception as e:
+                log.error("snapshot on_saved callback error: %s", e)
+
+    def _worker(self):
+        next_sweep = time.monotonic()
+        while True:
+            try:
+                self._write(*self.jobs.get(timeout=max(0.0, next_sweep - time.monotonic())))
+            except Empty:
+                pass
+            if time.monotonic() >= next_sweep:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    log.error("snapshot retention sweep failed: %s", e)
+                next_sweep = time.monotonic() + self.sweep_interval
+
+    def sweep(self, now=None):
+        """Applies the retention policy; returns the number of snapshots evicted."""
+        t = snapshots_table
+        cutoff = (now or time.time()) - self.max_age if self.max_age else None
+        victims = []
+        with self.engine.connect() as conn:
+            kept = select(t.c.id, t.c.path, t.c.thumb_path, t.c.bytes)
+            if cutoff is not None:
+                victims += conn.execute(select(t.c.id, t.c.path, t.c.thumb_path).where(t.c.created < cutoff)).all()
+                kept = kept.where(t.c.created >= cutoff)
+            sub = kept.subquery()
+            total = conn.execute(select(func.coalesce(func.sum(sub.c.bytes), 0))).scalar()
+            if self.max_bytes and total > self.max_bytes:
+                # oldest first until what's left fits
+                for row in conn.execute(kept.order_by(t.c.created.asc())):
+                    if total <= self.max_bytes:
+                        break
+                    victims.append(row[:3])
+                    total -= row.bytes
+        if not victims:
+            return 0
+        for _, path, thumb_path in victims:
+            for p in (path, thumb_path):
+                if p and os.path.exists(p):
+                    os.remove(p)
+            self._remove_empty_dirs(os.path.dirname(path))
+        with self.engine.begin() as conn:
+            conn.execute(delete(t).where(t.c.id.in_([v[0] for v in victims])))
+        self.evicted += len(victims)
+        log.info("snapshot retention evicted=%d", len(victims))
+        return len(victims)
+
+    def _remove_empty_dirs(self, d):
+        # drop emptied camera/date shards, never the root itself
+        root = os.path.abspath(self.root)
+        d = os.path.abspath(d)
+        while d != root and d.startswith(root) and not os.listdir(d):
+            os.rmdir(d)
+            d = os.path.dirname(d)
+
+    def list(self, camera_id=None, before=None, limit=50):
+        """Newest first; before=<id> pages back."""
+        t = snapshots_table
+        q = select(t).order_by(t.c.id.desc()).limit(limit)
+        if camera_id is not None:
+            q = q.where(t.c.camera_id == camera_id)
+        if before is not None:
+            q = q.where(t.c.id < before)
+        with self.engine.connect() as conn:
+            return [dict(r) for r in conn.execute(q).mappings()]
+
+    def stats(self):
+        t = snapshots_table
+        with self.engine.connect() as conn:
+            count, total = conn.execute(select(func.count(), func.coalesce(func.sum(t.c.bytes), 0))).one()
+        return {'count': count, 'bytes': total, 'queued': self.jobs.qsize(), 'evicted': self.evicted}
@@ -0,0 +1,80 @@
+import cv2
+import threading
+import numpy as np
+
+
+def _part(jpeg_bytes):
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
+
+
+class FrameBroadcaster:
+    """
+    Encodes each published frame once and fans the JPEG out to every MJPEG viewer.
+    Viewers block on a condition variable until a newer frame exists; each one tracks
+    the sequence number it last sent, so a slow viewer skips straight to the newest frame
+    instead of stealing frames from others. Nothing is encoded while nobody is watching.
+    """
+    def __init__(self, quality=70, size=(640, 360), every_n=2, idle_timeout=2.0):
+        self.quality = quality
+        self.size = size            # (w, h) to resize to before encoding, or None
+        self.every_n = every_n      # stream only every Nth published frame
+        self.idle_timeout = idle_timeout
+        self.cond = threading.Condition()
+        self.latest = None
+        self.seq = 0
+        self.published = 0
+        self.subscribers = 0
+        self.closed = False
+        self._blank = None
+
+    def encode(self, frame):
+        if hasattr(frame, 'jpeg'):
+            # frames.AnnotatedFrame: rendered and encoded on demand, shared with other consumers
+            return frame.jpeg(self.quality, self.size)
+        if self.size:
+            frame = cv2.resize(frame, self.size)
+        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        return buffer.tobytes() if ret else None
+
+    def publish(self, frame):
+        self.published += 1
+        if self.subscribers == 0 or self.published % self.every_n != 0:
+            return
+        jpeg = self.encode(frame)
+        if jpeg is None:
+            return
+        with self.cond:
+            self.latest = jpeg
+            self.seq += 1
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def _blank_part(self):
+        # sent when no frame arrives for idle_timeout so the browser keeps the stream open
+        if self._blank is None:
+            w, h = self.size or (640, 360)
+            self._blank = _part(self.encode(np.zeros((h, w, 3), dtype=np.uint8)))
+        return self._blank
+
+    def subscribe(self):
+        """Generator of multipart/x-mixed-replace chunks for one viewer."""
+        with self.cond:
+            self.subscribers += 1
+            last_seq = self.seq
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.closed or self.seq != last_seq, timeout=self.idle_timeout)
+                    if self.closed:
+                        return
+                    fresh = self.seq != last_seq
+                    last_seq, jpeg = self.seq, self.latest
+                yield _part(jpeg) if fresh else self._blank_part()
+        finally:
+            with self.cond:
+                self.subscribers -= 1
@@ -1,20 +1,87 @@
 import cv2
+import numpy as np
 
 class TamperDetector:
+    """
+    Camera tamper checks on a small grayscale thumbnail split into a grid of tiles.
+    Besides whole-frame black/white/blur and freeze checks, a running background
+    thumbnail is kept so that partial occlusion (hand/sticker over part of the lens),
+    spray-paint / fogging (texture lost over most tiles) and repositioning (scene no
+    longer matches the background) can be told apart. With every_n > 1 only every
+    Nth frame is examined and the last result is returned in between.
+    """
     def __init__(self, mean_black_thresh=10, mean_white_thresh=245, std_blur_thresh=8,
-                 freeze_diff_thresh=2, freeze_duration=3, fps=25):
+                 freeze_diff_thresh=2, freeze_duration=3, fps=25, every_n=1,
+                 thumb_size=(64, 48), grid=(4, 4), bg_alpha=0.02, warmup=25,
+                 tile_diff_thresh=25, tile_texture_ratio=0.35, partial_fraction=0.25,
+                 obscured_fraction=0.6, moved_fraction=0.6, persist=10):
         self.prev_gray = None
         self.freeze_counter = 0
         self.mean_black_thresh = mean_black_thresh
         self.mean_white_thresh = mean_white_thresh
         self.std_blur_thresh = std_blur_thresh
         self.freeze_diff_thresh = freeze_diff_thresh
-        self.freeze_limit = int(fps * freeze_duration)   # convert seconds frames
+        self.every_n = max(1, every_n)
+        self.freeze_limit = int(fps * freeze_duration / self.every_n)   # convert seconds to checks
+        self.thumb_size = thumb_size      # (w, h); must divide evenly by grid
+        self.grid = grid                  # (cols, rows)
+        self.bg_alpha = bg_alpha
+        self.warmup = warmup
+        self.tile_diff_thresh = tile_diff_thresh
+        self.tile_texture_ratio = tile_texture_ratio
+        self.partial_fraction = partial_fraction
+        self.obscured_fraction = obscured_fraction
+        self.moved_fraction = moved_fraction
+        self.persist = persist
+        self.bg = None           # running background thumbnail (float32)
+        self.bg_tile_std = None
+        self.checks = 0
+        self.frame_count = 0
+        self.suspect = {}        # {reason: consecutive checks}
+        self.last_result = {'covered': False}
+
+    def _thumbnail(self, frame):
+        w, h = self.thumb_size
+        # cheap stride decimation first so INTER_AREA only touches a fraction of the pixels
+        step = max(1, frame.shape[1] // (w * 4))
+        small = cv2.resize(frame[::step, ::step], (w, h), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def _tiles(self, gray):
+        cols, rows = self.grid
+        h, w = gray.shape
+        return gray.reshape(rows, h // rows, cols, w // cols).swapaxes(1, 2).reshape(rows * cols, -1)
+
+    def _persisted(self, reason, active):
+        self.suspect[reason] = self.suspect.get(reason, 0) + 1 if active else 0
+        return self.suspect[reason] >= self.persist
 
     def check(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        mean = float(gray.mean())
-        std = float(gray.std())
+        self.frame_count += 1
+        if (self.frame_count - 1) % self.every_n != 0:
+            return self.last_result
+        self.last_result = self._check(self._thumbnail(frame))
+        return self.last_result
+
+    def _check(self, gray):
+        self.checks += 1
+        tiles = self._tiles(gray)
+        # single pass over the thumbnail: per-tile sums give the global stats too
+        tile_mean = tiles.mean(axis=1)
+        tile_std = tiles.std(axis=1)
+        mean = float(tile_mean.mean())
+        std = float(np.sqrt((tile_std ** 2 + (tile_mean - mean) ** 2).mean()))
+
+        # freeze is tracked on every check, whatever else the frame shows
+        frozen = False
+        if self.prev_gray is not None:
+            avg_diff = float(np.abs(gray - self.prev_gray).mean())
+            if avg_diff < self.freeze_diff_thresh:
+                self.freeze_counter += 1
+            else:
+                self.freeze_counter = 0
+            frozen = self.freeze_counter >= self.freeze_limit
+        self.prev_gray = gray
 
         if mean < self.mean_black_thresh:
             return {'covered': True, 'reason': 'black_frame'}
@@ -23,15 +90,36 @@ class TamperDetector:
         if std < self.std_blur_thresh:
             return {'covered': True, 'reason': 'blurred'}
 
-        if self.prev_gray is not None:
-            diff = cv2.absdiff(gray, self.prev_gray)
-            avg_diff = float(diff.mean())
-            if avg_diff < self.freeze_diff_thresh:
-                self.freeze_counter += 1
-            else:
-                self.freeze_counter = 0
-            if self.freeze_counter >= self.freeze_limit:
-                return {'covered': True, 'reason': 'frozen_frame'}
+        if self.bg is None:
+            self.bg = gray.copy()
+            self.bg_tile_std = tile_std
+            return {'covered': False}
 
-        self.prev_gray = gray
-        return {'covered': False}
+        result = {'covered': False}
+        learn = True
+        if self.checks > self.warmup:
+            bg_tiles = self._tiles(self.bg)
+            # compare structure, not brightness: remove each image's global mean first
+            diff = np.abs((tiles - mean) - (bg_tiles - float(bg_tiles.mean()))).mean(axis=1)
+            changed = diff > self.tile_diff_thresh
+            # tiles that lost most of their usual texture are covered, painted or fogged
+            flat = tile_std < self.tile_texture_ratio * np.maximum(self.bg_tile_std, 1.0)
+            n = len(tiles)
+            obscured = self._persisted('obscured', flat.sum() >= self.obscured_fraction * n)
+            partial = self._persisted('partial_occlusion', flat.sum() >= self.partial_fraction * n)
+            moved = self._persisted('camera_moved', (changed & ~flat).sum() >= self.moved_fraction * n)
+            # don't learn a view that is currently under suspicion
+            learn = not any(self.suspect.values())
+            if obscured:
+                result = {'covered': True, 'reason': 'obscured'}
+            elif partial:
+                result = {'covered': True, 'reason': 'partial_occlusion'}
+            elif moved:
+                # background keeps adapting, so a deliberate re-aim clears after a while
+                result, learn = {'covered': True, 'reason': 'camera_moved'}, True
+        if not result['covered'] and frozen:
+            result = {'covered': True, 'reason': 'frozen_frame'}
+        if learn:
+            cv2.accumulateWeighted(gray, self.bg, self.bg_alpha)
+            self.bg_tile_std += self.bg_alpha * (tile_std - self.bg_tile_std)
+        return result
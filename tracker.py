@@ -0,0 +1,132 @@
+import numpy as np
+from detectors import Detections, box_iou
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy comes with ultralytics, but fall back to greedy matching without it
+    linear_sum_assignment = None
+
+# Constant-velocity Kalman filter over [cx, cy, area, aspect, vcx, vcy, varea], as in SORT
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_H = np.eye(4, 7)
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+_P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+
+def _to_z(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return np.column_stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / np.maximum(h, 1e-6)])
+
+
+def _to_boxes(x):
+    w = np.sqrt(np.clip(x[:, 2] * x[:, 3], 0, None))
+    h = x[:, 2] / np.maximum(w, 1e-6)
+    return np.column_stack([x[:, 0] - w / 2, x[:, 1] - h / 2, x[:, 0] + w / 2, x[:, 1] + h / 2])
+
+
+def _match(iou, iou_threshold):
+    """Assign detections (rows) to tracks (cols); returns list of (det, track) pairs."""
+    if iou.size == 0:
+        return []
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-iou)
+    else:
+        # greedy: best remaining IoU first
+        order = np.dstack(np.unravel_index(np.argsort(-iou, axis=None), iou.shape))[0]
+        used_r, used_c, rows, cols = set(), set(), [], []
+        for r, c in order:
+            if r in used_r or c in used_c:
+                continue
+            used_r.add(r); used_c.add(c)
+            rows.append(r); cols.append(c)
+    return [(r, c) for r, c in zip(rows, cols) if iou[r, c] >= iou_threshold]
+
+
+class Tracker:
+    """
+    SORT-style multi-object tracker for person boxes.
+    update() is called with fresh detections and returns the matched tracks with a
+    stable 'track_id'; predict() is called on frames where the detector was skipped and
+    returns the same tracks with Kalman-extrapolated boxes. Output has the same form
+    (dict list or Detections) that was last passed to update().
+    Unmatched tracks are kept for max_age frames so a missed detection keeps its id.
+    """
+    def __init__(self, iou_threshold=0.3, max_age=15, min_hits=1):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.next_id = 1
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+        self.ids = np.zeros(0, np.int64)
+        self.hits = np.zeros(0, np.int64)
+        self.misses = np.zeros(0, np.int64)  # frames since last matched detection
+        self.scores = np.zeros(0, np.float32)
+        self._as_arrays = False
+        self._since_update = 0  # predict() calls since the last update()
+
+    def _step(self):
+        # area velocity must not drive the area negative
+        bad = self.x[:, 2] + self.x[:, 6] <= 0
+        self.x[bad, 6] = 0.0
+        self.x = self.x @ _F.T
+        self.P = _F @ self.P @ _F.T + _Q
+        self.misses += 1
+        keep = self.misses <= self.max_age
+        self.x, self.P, self.ids = self.x[keep], self.P[keep], self.ids[keep]
+        self.hits, self.misses, self.scores = self.hits[keep], self.misses[keep], self.scores[keep]
+
+    def _output(self):
+        # only tracks that were matched at the last update, extrapolated over skipped frames
+        live = (self.hits >= self.min_hits) & (self.misses <= self._since_update)
+        boxes = _to_boxes(self.x[live]).round().astype(np.int32)
+        dets = Detections(boxes, self.scores[live], np.zeros(int(live.sum()), np.int32), self.ids[live])
+        return dets if self._as_arrays else dets.to_dicts()
+
+    def predict(self):
+        """Advance all tracks one frame without detections (extrapolated boxes)."""
+        self._since_update += 1
+        self._step()
+        return self._output()
+
+    def update(self, persons):
+        self._as_arrays = isinstance(persons, Detections)
+        self._since_update = 0
+        if self._as_arrays:
+            det_boxes, det_scores = persons.boxes, persons.scores
+        else:
+            det_boxes = np.array([p['box'] for p in persons], dtype=np.float64).reshape(-1, 4)
+            det_scores = np.array([p.get('score', 0.0) for p in persons], dtype=np.float32)
+        self._step()
+        matches = _match(box_iou(det_boxes, _to_boxes(self.x)), self.iou_threshold)
+
+        if matches:
+            d_idx = np.array([m[0] for m in matches])
+            t_idx = np.array([m[1] for m in matches])
+            z = _to_z(det_boxes[d_idx])
+            P = self.P[t_idx]
+            S = _H @ P @ _H.T + _R
+            K = P @ _H.T @ np.linalg.inv(S)
+            innov = z - self.x[t_idx] @ _H.T
+            self.x[t_idx] += np.einsum('nij,nj->ni', K, innov)
+            self.P[t_idx] = (np.eye(7) - K @ _H) @ P
+            self.hits[t_idx] += 1
+            self.misses[t_idx] = 0
+            self.scores[t_idx] = det_scores[d_idx]
+
+        new = np.setdiff1d(np.arange(len(det_boxes)), [m[0] for m in matches])
+        if len(new):
+            x_new = np.zeros((len(new), 7))
+            x_new[:, :4] = _to_z(det_boxes[new])
+            self.x = np.vstack([self.x, x_new])
+            self.P = np.concatenate([self.P, np.repeat(_P0[None], len(new), axis=0)])
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + len(new))])
+            self.next_id += len(new)
+            self.hits = np.concatenate([self.hits, np.ones(len(new), np.int64)])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), np.int64)])
+            self.scores = np.concatenate([self.scores, det_scores[new]])
+        return self._output()